@@ -10,13 +10,36 @@ http://code.activestate.com/recipes/413838-memento-closure/
 意图: 在不破坏封装性的前提下，捕获一个对象的内部状态，并在该对象之外保存这个状态
 应用场景: 后悔药, 打游戏时的存档, 后退操作, 数据库事务管理. 保存和恢复操作, 回滚操作.
 
+Transaction只保存最近一次提交的状态. History保存多级撤销历史和命名的保存点(savepoint),
+快照经过pickle和zlib压缩, 超出内存预算时丢弃最老的保存点.
+MmapStore把快照写入mmap映射的临时文件, 按属性分别保存并去重, 读取时只反序列化用到的属性.
+TransactionalMethod是Transactional的低开销版本: 对ChangeTracked对象不预先保存快照,
+只在属性第一次被修改时记录旧值. 其他对象每次调用仍然保存一个浅快照.
+
+memento()会复制整个obj.__dict__. 对于继承ChangeTracked的对象, Transaction改用
+delta_memento(), 只记录自上次提交以来被修改的属性, 提交和回滚的开销与修改的属性数成正比.
+每个delta_memento()有自己的日志(journal), 所以同一个对象上的多个Transaction互不影响.
+日志保存在模块级的登记表中, 不在对象的__dict__里.
+
 *TL;DR
 Provides the ability to restore an object to its previous state.
 """
 
+import functools
+import hashlib
+import mmap
+import os
+import pickle
+import sys
+import tempfile
+import time
+import weakref
+import zlib
 from copy import copy
 from copy import deepcopy
 
+_now = getattr(time, 'monotonic', time.time)
+
 
 def memento(obj, deep=False):
     """ 使用到闭包语法, 保存obj状态到state中 """
@@ -30,6 +53,101 @@ def memento(obj, deep=False):
     return restore
 
 
+# 标记: 属性在检查点之前不存在
+_MISSING = object()
+
+
+class ChangeTracked(object):
+    """Records the old value of every attribute written after a checkpoint.
+
+    Every open journal of the object gets the value an attribute had before
+    its first write. Journals are opened by delta_memento().
+    """
+
+    def __setattr__(self, name, value):
+        self._remember(name)
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        self._remember(name)
+        object.__delattr__(self, name)
+
+    def _remember(self, name):
+        journals = _open_journals(self)
+        if journals:
+            old = self.__dict__.get(name, _MISSING)
+            for journal in journals:
+                if name not in journal:
+                    journal[name] = old
+
+
+class _Journal(dict):
+    """ 属性名 -> 旧值, dict的子类才能被弱引用 """
+
+
+# id(obj) -> (obj的弱引用, [日志的弱引用]), 日志不再被引用时自动关闭
+_journals = {}
+
+
+def _open_journals(obj):
+    entry = _journals.get(id(obj))
+    if entry is None or entry[0]() is not obj:
+        return []
+    journals = [journal for journal in (ref() for ref in entry[1]) if journal is not None]
+    if len(journals) < len(entry[1]):
+        entry[1][:] = [weakref.ref(journal) for journal in journals]
+    return journals
+
+
+def _open_journal(obj):
+    key = id(obj)
+    entry = _journals.get(key)
+    if entry is None or entry[0]() is not obj:
+        def forget(ref):
+            if _journals.get(key, (None,))[0] is ref:
+                del _journals[key]
+        entry = _journals[key] = (weakref.ref(obj, forget), [])
+    journal = _Journal()
+    entry[1].append(weakref.ref(journal))
+    return journal
+
+
+def _close_journal(obj, journal):
+    entry = _journals.get(id(obj))
+    if entry is None or entry[0]() is not obj:
+        return
+    entry[1][:] = [ref for ref in entry[1] if ref() is not None and ref() is not journal]
+    if not entry[1]:
+        del _journals[id(obj)]
+
+
+def _undo(obj, journal):
+    # restoring is a write as well, the other open journals record it
+    others = [other for other in _open_journals(obj) if other is not journal]
+    for name, value in journal.items():
+        current = obj.__dict__.get(name, _MISSING)
+        for other in others:
+            if name not in other:
+                other[name] = current
+        if value is _MISSING:
+            obj.__dict__.pop(name, None)
+        else:
+            obj.__dict__[name] = value
+    journal.clear()
+
+
+def delta_memento(obj):
+    """ 增量版本的memento, obj必须是ChangeTracked对象.
+    restore()恢复到调用delta_memento()时的状态, 只要restore还被引用, 日志就一直记录.
+    """
+    journal = _open_journal(obj)
+
+    def restore():
+        _undo(obj, journal)
+
+    return restore
+
+
 class Transaction(object):
     """A transaction guard(守卫, 警备).
 
@@ -46,7 +164,11 @@ class Transaction(object):
 
     def commit(self):
         """ 提交并保存状态 """
-        self.states = [memento(target, self.deep) for target in self.targets]
+        # deep=True也要保存嵌套容器的内部修改, ChangeTracked记录不到, 只能整体deepcopy
+        self.states = [
+            delta_memento(target) if isinstance(target, ChangeTracked) and not self.deep else memento(target, self.deep)
+            for target in self.targets
+        ]
 
     def rollback(self):
         """ 回滚并恢复老状态 """
@@ -54,6 +176,219 @@ class Transaction(object):
             a_state()
 
 
+class CompressedStore(object):
+    """ 快照存储: pickle后用zlib压缩, 保存在内存中 """
+
+    def __init__(self, level=1):
+        self.level = level
+
+    def save(self, states):
+        return zlib.compress(pickle.dumps(states, pickle.HIGHEST_PROTOCOL), self.level)
+
+    def load(self, token):
+        return pickle.loads(zlib.decompress(token))
+
+    def size(self, token):
+        return len(token)
+
+    def discard(self, token):
+        pass
+
+
+class MmapStore(object):
+    """Snapshots spilled to a memory-mapped temporary file.
+
+    Every attribute is pickled on its own, and a value already written by an
+    earlier snapshot is not written again, so checkpoints of big objects with
+    few changes stay small. load() returns lazy mappings which only read
+    the attributes they are asked for.
+
+    restore() is what History.rollback() uses. It keeps an attribute which
+    still holds the immutable object saved or restored last for the same
+    location in the file, and only reads the others. Mutable values are
+    always read again, changes made to them in place can't be seen.
+
+    The file is append-only: discard() frees nothing and the file only grows
+    until close() deletes it. size() is 0 as the snapshots take no memory
+    budget.
+    """
+
+    def __init__(self, directory=None):
+        fd, self.path = tempfile.mkstemp(prefix='memento-', dir=directory)
+        self._file = os.fdopen(fd, 'w+b')
+        self._end = 0
+        self._map = None
+        self._offsets = {}  # digest -> (offset, length)
+        # per target: name -> (location, value) of the last save or restore
+        self._live = []
+
+    def save(self, states):
+        token = [dict((name, self._write(value)) for name, value in state.items()) for state in states]
+        self._remember(token, states)
+        return token
+
+    def restore(self, token, targets):
+        """Set the attributes of targets to the snapshot token, reading only what changed"""
+        states = []
+        live_states = self._live if len(self._live) == len(token) else [{}] * len(token)
+        for target, index, live_state in zip(targets, token, live_states):
+            state = {}
+            for name, location in index.items():
+                live = live_state.get(name)
+                current = target.__dict__.get(name, _MISSING)
+                if live is not None and live[0] == location and live[1] is current and _immutable(current):
+                    state[name] = current
+                else:
+                    state[name] = self._read(*location)
+            states.append(state)
+        for target, state in zip(targets, states):
+            target.__dict__.clear()
+            target.__dict__.update(state)
+        self._remember(token, states)
+
+    def _remember(self, token, states):
+        self._live = [
+            dict((name, (location, state[name])) for name, location in index.items())
+            for index, state in zip(token, states)
+        ]
+
+    def load(self, token):
+        return [_LazyState(self, index) for index in token]
+
+    def size(self, token):
+        return 0
+
+    def discard(self, token):
+        pass
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+        os.remove(self.path)
+
+    def _write(self, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha1(data).digest()
+        if digest not in self._offsets:
+            self._file.seek(self._end)
+            self._file.write(data)
+            self._offsets[digest] = (self._end, len(data))
+            self._end += len(data)
+        return self._offsets[digest]
+
+    def _read(self, offset, length):
+        if self._map is None or len(self._map) < offset + length:
+            self._file.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return pickle.loads(self._map[offset:offset + length])
+
+
+def _immutable(value):
+    if isinstance(value, (type(None), bool, int, float, complex, str, bytes, type(u''))):
+        return True
+    if type(value) in (tuple, frozenset):
+        return all(_immutable(item) for item in value)
+    return False
+
+
+class _LazyState(object):
+    """ 只在访问时才从文件读取属性值 """
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def keys(self):
+        return self._index.keys()
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, name):
+        return self._store._read(*self._index[name])
+
+
+class History(object):
+    """Multi-level undo for a group of objects.
+
+    commit() adds a savepoint, rollback() goes back to the latest one or to
+    a named one, dropping the savepoints after it. Like SQL SAVEPOINT, a
+    commit with the name of an existing savepoint replaces the old one. When the snapshots take
+    more than budget bytes the oldest savepoints are dropped, the latest one
+    is always kept. Pass store=MmapStore() to keep them on disk instead.
+    """
+
+    def __init__(self, targets, budget=None, store=None):
+        self.targets = targets
+        self.budget = budget
+        self.store = store if store is not None else CompressedStore()
+        self._savepoints = []  # [(name, token)], oldest first
+        self._size = 0
+        self._next_name = 0
+
+    @property
+    def savepoints(self):
+        return [name for name, _ in self._savepoints]
+
+    @property
+    def size(self):
+        return self._size
+
+    def commit(self, name=None):
+        """ 添加保存点, 返回它的名字 """
+        if name is None:
+            name = self._next_name
+            self._next_name += 1
+        states = [
+            dict(target.__dict__)
+            for target in self.targets
+        ]
+        token = self.store.save(states)
+        if name in self.savepoints:
+            self._drop(self.savepoints.index(name))
+        self._savepoints.append((name, token))
+        self._size += self.store.size(token)
+        while self.budget is not None and self._size > self.budget and len(self._savepoints) > 1:
+            self._drop(0)
+        return name
+
+    def snapshot(self, name):
+        """ 保存点的状态, 每个target一个映射, 不修改targets """
+        return self.store.load(dict(self._savepoints)[name])
+
+    def rollback(self, name=None):
+        """ 回滚到最近的或者指定名字的保存点 """
+        names = self.savepoints
+        if name is None and names:
+            name = names[-1]
+        if name not in names:
+            raise KeyError(name)
+        position = names.index(name)
+        while len(self._savepoints) > position + 1:
+            self._drop(-1)
+        token = self._savepoints[position][1]
+        restore = getattr(self.store, 'restore', None)
+        if restore is not None:
+            restore(token, self.targets)
+            return
+        states = self.store.load(token)
+        for target, state in zip(self.targets, states):
+            target.__dict__.clear()
+            target.__dict__.update(state)
+
+    def _drop(self, position):
+        _, token = self._savepoints.pop(position)
+        self._size -= self.store.size(token)
+        self.store.discard(token)
+
+
 class Transactional(object):
     """Adds transactional semantics to methods. Methods decorated  with
 
@@ -85,6 +420,58 @@ class Transactional(object):
         return transaction
 
 
+class TransactionalMethod(object):
+    """Transactional semantics for hot methods.
+
+    Changes of ChangeTracked objects are journaled on their first write, so
+    a call which writes nothing costs no snapshot at all. Only those get the
+    lazy snapshots: other objects still get a full shallow memento on every
+    call, like with Transactional, and save just the print and the closure.
+
+    The bound method is a small __slots__ object made on every access, like
+    a plain bound method. It is not cached in the instance __dict__, where
+    copy.copy() would copy it still bound to the original object.
+    """
+
+    def __init__(self, method):
+        self.method = method
+        functools.update_wrapper(self, method)
+
+    def __get__(self, obj, T):
+        if obj is None:
+            return self
+        return _BoundTransaction(self.method, obj)
+
+
+class _BoundTransaction(object):
+    __slots__ = ('method', 'obj')
+
+    def __init__(self, method, obj):
+        self.method = method
+        self.obj = obj
+
+    def __call__(self, *args, **kwargs):
+        obj = self.obj
+        if not isinstance(obj, ChangeTracked):
+            state = memento(obj)
+            try:
+                return self.method(obj, *args, **kwargs)
+            except Exception:
+                state()
+                raise
+
+        # a journal of our own, the journals of enclosing transactions
+        # keep recording as well
+        journal = _open_journal(obj)
+        try:
+            return self.method(obj, *args, **kwargs)
+        except Exception:
+            _undo(obj, journal)
+            raise
+        finally:
+            _close_journal(obj, journal)
+
+
 class NumObj(object):
     """ 真正的业务对象, 需要对该业务对象进行状态保存, 状态回滚等操作 """
     def __init__(self, value):
@@ -103,6 +490,42 @@ class NumObj(object):
         self.increment()  # <- will fail and rollback
 
 
+class TrackedNumObj(ChangeTracked, NumObj):
+    """ 提交和回滚只处理修改过的属性 """
+
+    @TransactionalMethod
+    def do_stuff(self):
+        self.value = '1111'  # <- invalid value
+        self.increment()  # <- will fail and rollback
+
+
+def benchmark(calls=10 ** 5):
+    """Call overhead of Transactional and TransactionalMethod on a hot method"""
+    def increment(self):
+        self.value += 1
+
+    classes = [
+        ('Transactional', type('Plain', (NumObj,), {'increment': Transactional(increment)})),
+        ('TransactionalMethod', type('Plain', (NumObj,), {'increment': TransactionalMethod(increment)})),
+        ('TransactionalMethod, ChangeTracked',
+         type('Tracked', (ChangeTracked, NumObj), {'increment': TransactionalMethod(increment)})),
+    ]
+    for name, cls in classes:
+        obj = cls(0)
+        # Transactional prints on every call
+        devnull = open(os.devnull, 'w')
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            start = _now()
+            for _ in range(calls):
+                obj.increment()
+            elapsed = _now() - start
+        finally:
+            sys.stdout = stdout
+            devnull.close()
+        print('{:<36} {:.2f} us per call'.format(name, elapsed * 10 ** 6 / calls))
+
+
 def main():
     """
     >>> num_obj = NumObj(-1)
@@ -155,9 +578,115 @@ def main():
 
     >>> print(num_obj)
     <NumObj: 2>
+
+    >>> tracked = TrackedNumObj(-1)
+    >>> tracked.name = 'tracked'
+    >>> a_transaction = Transaction(False, tracked)
+    >>> tracked.increment()
+    >>> tracked.note = 'added after commit'
+    >>> del tracked.name
+    >>> a_transaction.rollback()
+    >>> tracked, tracked.name, hasattr(tracked, 'note')
+    (<TrackedNumObj: -1>, 'tracked', False)
+    >>> sorted(vars(tracked))
+    ['name', 'value']
+
+    # Every transaction has its own journal
+    >>> first = Transaction(False, tracked)
+    >>> tracked.value = 5
+    >>> second = Transaction(False, tracked)
+    >>> tracked.value = 6
+    >>> second.rollback()
+    >>> tracked.value
+    5
+    >>> first.rollback()
+    >>> tracked.value
+    -1
+
+    # rolling back one transaction is a change for the others
+    >>> first = Transaction(False, tracked)
+    >>> tracked.value = 2
+    >>> second = Transaction(False, tracked)
+    >>> first.rollback()
+    >>> second.rollback()
+    >>> tracked.value
+    2
+
+    >>> num_obj = NumObj(0)
+    >>> history = History([num_obj], budget=200)
+    >>> history.commit('start')
+    'start'
+    >>> for i in range(3):
+    ...     num_obj.increment()
+    ...     history.commit()
+    0
+    1
+    2
+    >>> num_obj.value = 'garbage'
+    >>> history.rollback()
+    >>> num_obj
+    <NumObj: 3>
+    >>> history.rollback(1)
+    >>> num_obj, history.savepoints
+    (<NumObj: 2>, ['start', 0, 1])
+    >>> history.rollback('start')
+    >>> num_obj
+    <NumObj: 0>
+
+    # Reusing a name replaces the savepoint
+    >>> _ = history.commit('x')
+    >>> num_obj.value = 1
+    >>> _ = history.commit('x')
+    >>> num_obj.value = 2
+    >>> history.rollback('x')
+    >>> num_obj, history.savepoints
+    (<NumObj: 1>, ['start', 'x'])
+
+    # Old savepoints are dropped to stay within the budget
+    >>> for i in range(20):
+    ...     num_obj.value = 'x' * 20 + str(i)
+    ...     _ = history.commit()
+    >>> history.size <= 200, len(history.savepoints) < 21
+    (True, True)
+
+    # Snapshots can also be spilled to a memory-mapped file
+    >>> store = MmapStore()
+    >>> num_obj = NumObj(0)
+    >>> num_obj.big = big = tuple(range(10000))
+    >>> history = History([num_obj], store=store)
+    >>> for i in range(100):
+    ...     num_obj.value = i
+    ...     _ = history.commit()
+    >>> history.snapshot(42)[0]['value']
+    42
+    >>> history.rollback(42)
+    >>> num_obj.value, len(num_obj.big)
+    (42, 10000)
+
+    # unchanged immutable attributes are not read back from the file
+    >>> num_obj.big is big
+    True
+    >>> store.close()
+
+    >>> tracked = TrackedNumObj(2)
+    >>> try:
+    ...    tracked.do_stuff()
+    ... except TypeError:
+    ...    print('-> doing stuff failed!')
+    -> doing stuff failed!
+    >>> tracked
+    <TrackedNumObj: 2>
+
+    # a copy calls the method on itself, not on the original
+    >>> import copy
+    >>> copy.copy(tracked).do_stuff.obj is tracked
+    False
     """
 
 
 if __name__ == "__main__":
-    import doctest
-    doctest.testmod(optionflags=doctest.ELLIPSIS)
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        import doctest
+        doctest.testmod(optionflags=doctest.ELLIPSIS)
@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+行为模式--备忘录模式, 持久化数据结构版本
+
+memento(obj, deep=True)每次都要deepcopy整个对象, 包括很少改变的大容器.
+如果对象的状态保存在不可变的持久化数据结构(PVector, PMap)中, 修改会返回新版本,
+新旧版本共享未改变的子树(structural sharing). 如果所有元素也都是不可变的(比如用freeze()
+转换过的数据), 它们的__deepcopy__直接返回自身, 所以memento()的deepcopy只复制真正的可变部分,
+连续的快照共享未改变的数据. 含有可变元素(比如list)时, deepcopy会复制整个容器.
+是否全部不可变的标记随set/append增量维护, 只有无法确定时才遍历一次.
+
+PVector: 32叉树(trie), set/append只复制根到叶子路径上的节点.
+PMap: HAMT(hash array mapped trie), 每层用hash的5位选择子节点, 用位图压缩空槽.
+
+*TL;DR
+Snapshots of immutable state are free: successive versions share unchanged subtrees.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+from copy import deepcopy
+
+try:
+    import tracemalloc
+except ImportError:  # python 2, the benchmark only reports the time
+    tracemalloc = None
+
+_now = getattr(time, 'perf_counter', time.time)
+
+try:
+    from patterns.behavioral.memento import memento
+except ImportError:  # run as a script, e.g. by run_all.sh
+    from memento import memento
+
+_BITS = 5
+_WIDTH = 1 << _BITS
+_MASK = _WIDTH - 1
+
+
+class PVector(object):
+    """Persistent vector, a 32-way trie of tuples"""
+
+    # _immutable: True if every element is immutable, None if not known yet
+    __slots__ = ('_count', '_shift', '_root', '_immutable')
+
+    def __init__(self, items=()):
+        vector = PVector._make(0, _BITS, (), True)
+        for item in items:
+            vector = vector.append(item)
+        self._count, self._shift, self._root = vector._count, vector._shift, vector._root
+        self._immutable = vector._immutable
+
+    @classmethod
+    def _make(cls, count, shift, root, immutable):
+        vector = object.__new__(cls)
+        vector._count, vector._shift, vector._root = count, shift, root
+        vector._immutable = immutable
+        return vector
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        node = self._root
+        for level in range(self._shift, 0, -_BITS):
+            node = node[(index >> level) & _MASK]
+        return node[index & _MASK]
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+    def __eq__(self, other):
+        return isinstance(other, PVector) and len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'PVector({!r})'.format(list(self))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        if _all_immutable(self):
+            return self
+        return PVector(deepcopy(item, memo) for item in self)
+
+    def _elements(self):
+        return iter(self)
+
+    def set(self, index, value):
+        """Return a new vector with value at index"""
+        if index < 0:
+            index += self._count
+        if index == self._count:
+            return self.append(value)
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        if not _is_immutable(value):
+            immutable = False
+        else:
+            # a replaced mutable element may have been the only one
+            immutable = True if self._immutable else None
+        return PVector._make(self._count, self._shift, self._set(self._root, self._shift, index, value), immutable)
+
+    @staticmethod
+    def _set(node, level, index, value):
+        slot = (index >> level) & _MASK
+        child = value if level == 0 else PVector._set(node[slot], level - _BITS, index, value)
+        return node[:slot] + (child,) + node[slot + 1:]
+
+    def append(self, value):
+        """Return a new vector with value added at the end"""
+        index = self._count
+        # one mutable element makes the whole vector mutable for good
+        immutable = self._immutable and _is_immutable(value)
+        if index >> self._shift >= _WIDTH:
+            # the trie is full, add a level on top
+            root = PVector._push((self._root,), self._shift + _BITS, index, value)
+            return PVector._make(index + 1, self._shift + _BITS, root, immutable)
+        return PVector._make(index + 1, self._shift, PVector._push(self._root, self._shift, index, value), immutable)
+
+    @staticmethod
+    def _push(node, level, index, value):
+        slot = (index >> level) & _MASK
+        if level == 0:
+            return node + (value,)
+        child = node[slot] if slot < len(node) else ()
+        child = PVector._push(child, level - _BITS, index, value)
+        return node[:slot] + (child,)
+
+
+class PMap(object):
+    """Persistent hash map, a hash array mapped trie"""
+
+    # _immutable: True if every key and value is immutable, None if not known yet
+    __slots__ = ('_count', '_root', '_immutable')
+
+    def __init__(self, items=()):
+        pmap = PMap._make(0, _BitmapNode(0, ()), True)
+        if hasattr(items, 'items'):
+            items = items.items()
+        for key, value in items:
+            pmap = pmap.set(key, value)
+        self._count, self._root, self._immutable = pmap._count, pmap._root, pmap._immutable
+
+    @classmethod
+    def _make(cls, count, root, immutable):
+        pmap = object.__new__(cls)
+        pmap._count, pmap._root = count, root
+        pmap._immutable = immutable
+        return pmap
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, key):
+        value = self._root.find(0, hash(key), key, _NOT_FOUND)
+        if value is _NOT_FOUND:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        return self._root.find(0, hash(key), key, default)
+
+    def __contains__(self, key):
+        return self._root.find(0, hash(key), key, _NOT_FOUND) is not _NOT_FOUND
+
+    def __iter__(self):
+        for key, _ in self._root.items():
+            yield key
+
+    def items(self):
+        return self._root.items()
+
+    def __eq__(self, other):
+        return isinstance(other, PMap) and len(self) == len(other) and all(
+            other.get(key, _NOT_FOUND) == value for key, value in self.items()
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'PMap({!r})'.format(dict(self.items()))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        if _all_immutable(self):
+            return self
+        return PMap((deepcopy(key, memo), deepcopy(value, memo)) for key, value in self.items())
+
+    def _elements(self):
+        for key, value in self.items():
+            yield key
+            yield value
+
+    def set(self, key, value):
+        """Return a new map with key set to value"""
+        added = []
+        root = self._root.assoc(0, hash(key), key, value, added)
+        if root is self._root:
+            return self
+        if not (_is_immutable(key) and _is_immutable(value)):
+            immutable = False
+        elif self._immutable or (self._immutable is False and added):
+            immutable = self._immutable
+        else:
+            # a replaced mutable value may have been the only one
+            immutable = None
+        return PMap._make(self._count + len(added), root, immutable)
+
+    def delete(self, key):
+        """Return a new map without key"""
+        root = self._root.without(0, hash(key), key)
+        if root is self._root:
+            raise KeyError(key)
+        immutable = True if self._immutable else None
+        return PMap._make(self._count - 1, root if root is not None else _BitmapNode(0, ()), immutable)
+
+
+_NOT_FOUND = object()
+# key of an entry which holds a subtree
+_NODE = object()
+
+
+class _BitmapNode(object):
+    """Up to 32 entries, present slots are marked in bitmap.
+
+    An entry is a (key, value) pair, or (_NODE, node) for a subtree.
+    """
+
+    __slots__ = ('bitmap', 'entries')
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+    def _position(self, bit):
+        return bin(self.bitmap & (bit - 1)).count('1')
+
+    def find(self, shift, key_hash, key, default):
+        bit = 1 << ((key_hash >> shift) & _MASK)
+        if not self.bitmap & bit:
+            return default
+        entry_key, value = self.entries[self._position(bit)]
+        if entry_key is _NODE:
+            return value.find(shift + _BITS, key_hash, key, default)
+        return value if entry_key == key else default
+
+    def assoc(self, shift, key_hash, key, value, added):
+        bit = 1 << ((key_hash >> shift) & _MASK)
+        position = self._position(bit)
+        if not self.bitmap & bit:
+            added.append(key)
+            entries = self.entries[:position] + ((key, value),) + self.entries[position:]
+            return _BitmapNode(self.bitmap | bit, entries)
+        entry_key, entry_value = self.entries[position]
+        if entry_key is _NODE:
+            node = entry_value.assoc(shift + _BITS, key_hash, key, value, added)
+            if node is entry_value:
+                return self
+            entry = (_NODE, node)
+        elif entry_key == key:
+            if entry_value is value:
+                return self
+            entry = (key, value)
+        else:
+            added.append(key)
+            entry = (_NODE, _merge(shift + _BITS, entry_key, entry_value, key_hash, key, value))
+        return _BitmapNode(self.bitmap, self.entries[:position] + (entry,) + self.entries[position + 1:])
+
+    def without(self, shift, key_hash, key):
+        bit = 1 << ((key_hash >> shift) & _MASK)
+        if not self.bitmap & bit:
+            return self
+        position = self._position(bit)
+        entry_key, entry_value = self.entries[position]
+        if entry_key is _NODE:
+            node = entry_value.without(shift + _BITS, key_hash, key)
+            if node is entry_value:
+                return self
+            if node is not None:
+                entries = self.entries[:position] + ((_NODE, node),) + self.entries[position + 1:]
+                return _BitmapNode(self.bitmap, entries)
+        elif entry_key != key:
+            return self
+        if self.bitmap == bit:
+            return None
+        return _BitmapNode(self.bitmap ^ bit, self.entries[:position] + self.entries[position + 1:])
+
+    def items(self):
+        for entry_key, value in self.entries:
+            if entry_key is _NODE:
+                for item in value.items():
+                    yield item
+            else:
+                yield entry_key, value
+
+
+class _CollisionNode(object):
+    """Keys whose hashes are equal in every bit the trie looks at"""
+
+    __slots__ = ('entries',)
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def find(self, shift, key_hash, key, default):
+        for entry_key, value in self.entries:
+            if entry_key == key:
+                return value
+        return default
+
+    def assoc(self, shift, key_hash, key, value, added):
+        for position, (entry_key, entry_value) in enumerate(self.entries):
+            if entry_key == key:
+                if entry_value is value:
+                    return self
+                return _CollisionNode(self.entries[:position] + ((key, value),) + self.entries[position + 1:])
+        added.append(key)
+        return _CollisionNode(self.entries + ((key, value),))
+
+    def without(self, shift, key_hash, key):
+        entries = tuple(entry for entry in self.entries if entry[0] != key)
+        if len(entries) == len(self.entries):
+            return self
+        return _CollisionNode(entries) if entries else None
+
+    def items(self):
+        return iter(self.entries)
+
+
+# python hashes have 64 bits at most, deeper levels can't tell keys apart
+_MAX_SHIFT = 64
+
+
+def _merge(shift, key1, value1, key2_hash, key2, value2):
+    if shift >= _MAX_SHIFT:
+        return _CollisionNode(((key1, value1), (key2, value2)))
+    node = _BitmapNode(0, ())
+    node = node.assoc(shift, hash(key1), key1, value1, [])
+    return node.assoc(shift, key2_hash, key2, value2, [])
+
+
+_ATOMS = (type(None), bool, int, float, complex, str, bytes, type(u''))
+
+
+def _is_immutable(value):
+    if isinstance(value, _ATOMS):
+        return True
+    if isinstance(value, (PVector, PMap)):
+        return _all_immutable(value)
+    if type(value) in (tuple, frozenset):
+        return all(_is_immutable(item) for item in value)
+    return False
+
+
+def _all_immutable(container):
+    """ 计算一次并缓存在容器中, 不可变的容器永远不会改变 """
+    if container._immutable is None:
+        container._immutable = all(_is_immutable(item) for item in container._elements())
+    return container._immutable
+
+
+def freeze(value):
+    """Convert nested dicts, lists and tuples into PMaps and PVectors"""
+    if isinstance(value, dict):
+        return PMap((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return PVector(freeze(item) for item in value)
+    return value
+
+
+class Document(object):
+    """ 业务对象, 大部分状态在持久化容器中 """
+
+    def __init__(self, rows):
+        self.title = 'untitled'
+        self.rows = PVector(rows)
+        self.index = PMap((row, number) for number, row in enumerate(rows))
+
+
+def benchmark(size=10 ** 5, snapshots=10):
+    """Time and memory of deep snapshots of a nested object with size elements"""
+
+    class Plain(object):
+        def __init__(self, rows):
+            self.title = 'untitled'
+            self.rows = list(rows)
+            self.index = {row: number for number, row in enumerate(rows)}
+
+    rows = ['row {}'.format(number) for number in range(size)]
+    for obj in (Plain(rows), Document(rows)):
+        if tracemalloc is not None:
+            tracemalloc.start()
+        start = _now()
+        states = []
+        for number in range(snapshots):
+            states.append(memento(obj, deep=True))
+            if isinstance(obj.rows, PVector):
+                obj.rows = obj.rows.set(number, 'changed')
+            else:
+                obj.rows[number] = 'changed'
+        elapsed = _now() - start
+        line = '{:<10} {:>8.2f} ms'.format(type(obj).__name__, elapsed * 1000 / snapshots)
+        if tracemalloc is not None:
+            size_used, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            line += ' {:>10.1f} KB'.format(size_used / 1024.0 / snapshots)
+        print(line + ' per snapshot')
+
+
+def main():
+    """
+    >>> vector = PVector(range(100))
+    >>> changed = vector.set(42, 'x').append(100)
+    >>> vector[42], changed[42], len(vector), len(changed)
+    (42, 'x', 100, 101)
+
+    >>> pmap = PMap({'a': 1, 'b': 2})
+    >>> changed = pmap.set('c', 3).delete('a')
+    >>> sorted(pmap.items()), sorted(changed.items())
+    ([('a', 1), ('b', 2)], [('b', 2), ('c', 3)])
+
+    >>> freeze({'rows': [1, 2], 'meta': {'title': 'x'}})['rows']
+    PVector([1, 2])
+
+    # only containers of immutable values are shared, mutable elements are copied
+    >>> import copy
+    >>> frozen = freeze([[1, 2]])
+    >>> copy.deepcopy(frozen) is frozen
+    True
+    >>> mutable = PVector([[1, 2]])
+    >>> copied = copy.deepcopy(mutable)
+    >>> mutable[0].append(3)
+    >>> copied
+    PVector([[1, 2]])
+
+    # deep snapshots copy only the mutable shell, the containers are shared
+    >>> doc = Document(['first', 'second'])
+    >>> restore = memento(doc, deep=True)
+    >>> old_rows = doc.rows
+    >>> doc.rows = doc.rows.set(0, 'changed')
+    >>> doc.title = 'draft'
+    >>> restore()
+    >>> doc.title, list(doc.rows), doc.rows is old_rows
+    ('untitled', ['first', 'second'], True)
+    """
+
+
+if __name__ == '__main__':
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        import doctest
+        doctest.testmod()
@@ -18,12 +18,28 @@ https://github.com/Pylons/pyramid/blob/7909e9503cdfc6f6e84d2c7ace1d3c03ca1d8b73/
 werkzeug
 https://github.com/pallets/werkzeug/blob/5a2bf35441006d832ab1ed5a31963cbc366c99ac/werkzeug/utils.py#L35
 
+The same idea works for modules: LazyModule stands in for a module and
+imports it on the first attribute access, lazy_import() builds a module
+level __getattr__ (PEP 562) which imports submodules on first use. This
+pays off for heavy modules which only some code paths need, e.g. asyncio
+in a command line tool. It does not for small modules: importing this one
+costs more than the few pattern modules a package would save.
+
 *TL;DR
 Delays the eval of an expr until its value is needed and avoids repeated evals.
 """
 
 from __future__ import print_function
 import functools
+import importlib
+import os
+import pkgutil
+import sys
+import threading
+import time
+import types
+
+_now = getattr(time, 'monotonic', time.time)
 
 
 class lazy_property(object):
@@ -39,6 +55,38 @@ class lazy_property(object):
         return val
 
 
+class synchronized_lazy_property(object):
+    """lazy_property which runs function once even if several threads ask at the same time.
+
+    The callers wait on a lock of their instance and attribute, kept in the
+    instance __dict__ only until the value is there. From then on the value
+    is found in __dict__ and the descriptor (and its lock) is skipped.
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.lock_name = '_lazy_lock__' + function.__name__
+        functools.update_wrapper(self, function)
+
+    def __get__(self, obj, type_):
+        if obj is None:
+            return self
+        name = self.function.__name__
+        try:
+            with obj.__dict__.setdefault(self.lock_name, threading.Lock()):
+                # another thread may have computed it while we were waiting
+                if name in obj.__dict__:
+                    return obj.__dict__[name]
+                val = self.function(obj)
+                obj.__dict__[name] = val
+                return val
+        finally:
+            # a late caller may have made a new lock after the first one was
+            # removed. Keep the lock if function raised, others wait on it
+            if name in obj.__dict__:
+                obj.__dict__.pop(self.lock_name, None)
+
+
 def lazy_property2(fn):
     attr = '_lazy__' + fn.__name__
 
@@ -51,7 +99,134 @@ def lazy_property2(fn):
     return _lazy_property
 
 
-class Person(object):
+class expiring_lazy_property(object):
+    """lazy_property whose value can go stale.
+
+    Use it as @expiring_lazy_property(ttl=seconds, depends_on=('attr', ...)).
+    Without ttl the value is cached in __dict__ just like lazy_property, so
+    reading it costs nothing until it is invalidated. With ttl the value has
+    to be checked on every read and is kept under '_lazy_ttl__' + name.
+    Setting an attribute listed in depends_on invalidates the value, as
+    long as the class inherits from LazyDependencies.
+    """
+
+    def __init__(self, ttl=None, depends_on=()):
+        self.ttl = ttl
+        self.depends_on = tuple(depends_on)
+        self.function = None
+
+    def __call__(self, function):
+        self.function = function
+        functools.update_wrapper(self, function)
+        return self
+
+    def __get__(self, obj, type_):
+        if obj is None:
+            return self
+        name = self.function.__name__
+        if self.ttl is None:
+            val = obj.__dict__[name] = self.function(obj)
+            return val
+        cached = obj.__dict__.get('_lazy_ttl__' + name)
+        if cached is not None and cached[1] > _now():
+            return cached[0]
+        val = self.function(obj)
+        obj.__dict__['_lazy_ttl__' + name] = (val, _now() + self.ttl)
+        return val
+
+
+class slot_lazy_property(object):
+    """lazy_property for classes with __slots__ and no __dict__.
+
+    The value is cached in the slot '_' + name, which the class declares.
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.slot = '_' + function.__name__
+        functools.update_wrapper(self, function)
+
+    def __get__(self, obj, type_):
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            val = self.function(obj)
+            setattr(obj, self.slot, val)
+            return val
+
+
+def invalidate(obj, name):
+    """Forget the cached value of a lazy property, the next read computes it again"""
+    attr = getattr(type(obj), name, None)
+    if isinstance(attr, slot_lazy_property):
+        try:
+            delattr(obj, attr.slot)
+        except AttributeError:
+            pass
+        return
+    for key in (name, '_lazy__' + name, '_lazy_ttl__' + name):
+        obj.__dict__.pop(key, None)
+
+
+class LazyDependencies(object):
+    """Invalidates expiring_lazy_property values when an attribute they depend on is set"""
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        for dependent in _dependents(type(self)).get(name, ()):
+            invalidate(self, dependent)
+
+
+def _dependents(cls):
+    """{attribute: names of the lazy properties depending on it}, cached per class"""
+    dependents = cls.__dict__.get('_lazy_dependents')
+    if dependents is None:
+        dependents = {}
+        for klass in reversed(cls.__mro__):
+            for name, attr in vars(klass).items():
+                if isinstance(attr, expiring_lazy_property):
+                    for dependency in attr.depends_on:
+                        dependents.setdefault(dependency, []).append(name)
+        cls._lazy_dependents = dependents
+    return dependents
+
+
+class LazyModule(types.ModuleType):
+    """A module which is only imported when one of its attributes is read.
+
+    The first read copies the module namespace into this one, later reads
+    don't reach __getattr__ any more (like lazy_property writing __dict__).
+    """
+
+    def __getattr__(self, name):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, name)
+
+
+def lazy_import(package, submodules=None):
+    """Return a module __getattr__ which imports package.submodule on first access.
+
+    Without submodules every module found in the package directory is allowed.
+    """
+    found = []
+
+    def __getattr__(name):
+        if not found:
+            found.append(frozenset(
+                submodules if submodules is not None else
+                (module[1] for module in pkgutil.iter_modules(sys.modules[package].__path__))
+            ))
+        if name in found[0]:
+            return importlib.import_module('.' + name, package)
+        raise AttributeError('module {!r} has no attribute {!r}'.format(package, name))
+
+    return __getattr__
+
+
+class Person(LazyDependencies):
     def __init__(self, name, occupation):
         self.name = name
         self.occupation = occupation
@@ -68,6 +243,36 @@ class Person(object):
         self.call_count2 += 1
         return "Father and mother"
 
+    @expiring_lazy_property(depends_on=('occupation',))
+    def business_card(self):
+        return "{}, {}".format(self.name, self.occupation)
+
+
+class Address(object):
+    __slots__ = ('street', 'city', '_label')
+
+    def __init__(self, street, city):
+        self.street = street
+        self.city = city
+
+    @slot_lazy_property
+    def label(self):
+        return "{}, {}".format(self.street, self.city)
+
+
+def benchmark(module='asyncio'):
+    """Startup time of a program which imports a heavy module but does not use it"""
+    import subprocess
+
+    setup = 'import sys, time\nsys.path.insert(0, {!r})\nfrom lazy_evaluation import LazyModule\n'.format(
+        os.path.dirname(os.path.abspath(__file__)))
+    eager = 'import {}\n'.format(module)
+    lazy = '{0} = LazyModule({0!r})\n'.format(module)
+    for name, code in (('eager', eager), ('lazy', lazy)):
+        timed = setup + 'start = time.time()\n' + code + 'print(time.time() - start)\n'
+        output = subprocess.check_output([sys.executable, '-c', timed], universal_newlines=True)
+        print('{:<6} import {}: {:.2f} ms'.format(name, module, float(output.split()[-1]) * 1000))
+
 
 def main():
     """
@@ -100,9 +305,52 @@ def main():
 
     >>> Jhon.call_count2
     1
+
+    # `business_card` depends on `occupation`
+    >>> Jhon.business_card
+    'Jhon, Coder'
+    >>> Jhon.occupation = 'Manager'
+    >>> 'business_card' in Jhon.__dict__
+    False
+    >>> Jhon.business_card
+    'Jhon, Manager'
+
+    >>> invalidate(Jhon, 'parents')
+    >>> Jhon.parents
+    'Father and mother'
+    >>> Jhon.call_count2
+    2
+
+    # Objects with __slots__ cache the value in a slot
+    >>> home = Address('Main street', 'Springfield')
+    >>> home.label
+    'Main street, Springfield'
+    >>> home._label
+    'Main street, Springfield'
+    >>> hasattr(home, '__dict__')
+    False
+
+    >>> json = LazyModule('json')
+    >>> 'dumps' in vars(json)
+    False
+    >>> json.dumps([1, 2])
+    '[1, 2]'
+    >>> 'dumps' in vars(json)
+    True
+
+    >>> json_getattr = lazy_import('json')
+    >>> json_getattr('decoder').__name__
+    'json.decoder'
+    >>> json_getattr('missing')
+    Traceback (most recent call last):
+    ...
+    AttributeError: module 'json' has no attribute 'missing'
     """
 
 
 if __name__ == "__main__":
-    import doctest
-    doctest.testmod(optionflags=doctest.ELLIPSIS)
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        import doctest
+        doctest.testmod(optionflags=doctest.ELLIPSIS)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Lazily-evaluated property pattern for asyncio code.
+
+lazy_property from lazy_evaluation.py calls a plain function. When the
+expensive value comes from the network or a database the function is a
+coroutine, and every caller that touches a cold instance would start its
+own fetch.
+
+async_lazy_property starts the coroutine as a task on first access and
+caches it in the instance __dict__, so all awaiters share the one fetch.
+Each await is shielded: a cancelled awaiter does not cancel the fetch for
+the others. A failed or cancelled fetch is dropped from the cache, so the
+next access tries again instead of re-raising the same error forever.
+
+*TL;DR
+Delays an awaitable load until it is needed and shares it between concurrent awaiters.
+"""
+
+import asyncio
+import functools
+
+
+class async_lazy_property(object):
+    def __init__(self, function):
+        self.function = function
+        functools.update_wrapper(self, function)
+
+    def __get__(self, obj, type_):
+        if obj is None:
+            return self
+        # has to be called from a coroutine, the task runs on its event loop
+        name = self.function.__name__
+        shared = obj.__dict__[name] = _SharedTask(asyncio.ensure_future(self.function(obj)))
+
+        def forget_failure(task):
+            if (task.cancelled() or task.exception() is not None) and obj.__dict__.get(name) is shared:
+                del obj.__dict__[name]
+
+        shared.task.add_done_callback(forget_failure)
+        return shared
+
+
+class _SharedTask(object):
+    """Awaitable any number of times, cancelling one await leaves the task running"""
+
+    def __init__(self, task):
+        self.task = task
+
+    def __await__(self):
+        return asyncio.shield(self.task).__await__()
+
+
+class Person(object):
+    def __init__(self, name):
+        self.name = name
+        self.fetch_count = 0
+        self.fail_next_fetch = False
+
+    @async_lazy_property
+    async def profile(self):
+        # Fetch the profile over the network, let's assume that it takes a while.
+        self.fetch_count += 1
+        await asyncio.sleep(0.01)
+        if self.fail_next_fetch:
+            self.fail_next_fetch = False
+            raise ConnectionError('profile service unavailable')
+        return 'Profile of {}'.format(self.name)
+
+
+def main():
+    """
+    >>> loop = asyncio.new_event_loop()
+    >>> Jhon = Person('Jhon')
+
+    >>> async def get_profile(person):
+    ...     return await person.profile
+    >>> async def get_profiles(person, count):
+    ...     return await asyncio.gather(*(get_profile(person) for _ in range(count)))
+
+    # Concurrent awaiters share one fetch
+    >>> loop.run_until_complete(get_profiles(Jhon, 3))
+    ['Profile of Jhon', 'Profile of Jhon', 'Profile of Jhon']
+    >>> Jhon.fetch_count
+    1
+
+    >>> loop.run_until_complete(get_profile(Jhon))
+    'Profile of Jhon'
+    >>> Jhon.fetch_count
+    1
+
+    # Failures are not cached
+    >>> Mary = Person('Mary')
+    >>> Mary.fail_next_fetch = True
+    >>> loop.run_until_complete(get_profile(Mary))
+    Traceback (most recent call last):
+    ...
+    ConnectionError: profile service unavailable
+    >>> loop.run_until_complete(get_profile(Mary))
+    'Profile of Mary'
+    >>> Mary.fetch_count
+    2
+
+    >>> loop.close()
+    """
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -20,6 +20,17 @@ with statement. But because it is released back into the pool
 afterwards it is reused by the explicit call to sample_queue.get().
 Same thing happens with "sam", when the ObjectPool created insided the
 function is deleted (by the GC) and the object is returned.
+ObjectPool puts objects back blindly, so a broken or stale object would be
+handed out again. HealthCheckedQueue can be used instead of queue.Queue to
+validate objects on borrow and on return, to evict objects which stayed idle
+for too long and to recycle objects after a maximum lifetime, optionally
+from a background reaper thread.
+PoolMetrics collects checkout counts, a wait time histogram, the high-water
+mark of objects in use and the call sites of objects held for too long.
+ShardedQueue spreads the objects over several shards with their own locks,
+so many threads checking objects in and out do not all fight for one lock.
+SharedBudgetQueue enforces one global cap on the objects created by all the
+worker processes of a pre-fork server.
 
 *Where is the pattern used practically?
 
@@ -31,34 +42,501 @@ https://sourcemaking.com/design_patterns/object_pool
 Stores a set of initialized objects kept ready to use.
 """
 
+try:
+    import queue
+except ImportError:  # python 2.x compatibility
+    import Queue as queue
+import collections
+import errno
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+_now = getattr(time, 'monotonic', time.time)
+
 
 class ObjectPool(object):
-    def __init__(self, queue, auto_get=False):
+    def __init__(self, queue, auto_get=False, metrics=None):
         self._queue = queue
-        self.item = self._queue.get() if auto_get else None
+        self._metrics = metrics
+        self.item = None
+        if auto_get:
+            self._checkout()
 
     def __enter__(self):
         if self.item is None:
-            self.item = self._queue.get()
+            self._checkout()
         return self.item
 
     def __exit__(self, Type, value, traceback):
         if self.item is not None:
-            self._queue.put(self.item)
-            self.item = None
+            self._checkin()
 
     def __del__(self):
         if self.item is not None:
-            self._queue.put(self.item)
-            self.item = None
+            self._checkin(by_gc=True)
 
+    def _checkout(self):
+        if self._metrics is None:
+            self.item = self._queue.get()
+            return
+        start = _now()
+        self.item = self._queue.get()
+        self._metrics.checked_out(self, _now() - start)
 
-def main():
+    def _checkin(self, by_gc=False):
+        self._queue.put(self.item)
+        self.item = None
+        if self._metrics is not None:
+            self._metrics.checked_in(self, by_gc)
+
+
+class PoolMetrics(object):
+    """Usage statistics of the ObjectPools sharing one queue.
+
+    Pass the same instance as metrics to every ObjectPool of a queue. Besides
+    counters it remembers where every object in use was checked out, so
+    leaks(threshold) can tell which call sites hold objects for too long,
+    and gc_returns counts objects only returned by ObjectPool.__del__.
+    """
+
+    # upper bounds (seconds) of the wait time histogram, the last bucket is open
+    wait_buckets = (0.001, 0.01, 0.1, 1.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._held = {}
+        self.checkouts = 0
+        self.gc_returns = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.total_wait = 0.0
+        self.wait_histogram = [0] * (len(self.wait_buckets) + 1)
+
+    def checked_out(self, checkout, wait):
+        held = (_now(), self._call_site())
+        bucket = len([bound for bound in self.wait_buckets if wait > bound])
+        with self._lock:
+            self._held[id(checkout)] = held
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.total_wait += wait
+            self.wait_histogram[bucket] += 1
+
+    def checked_in(self, checkout, by_gc=False):
+        with self._lock:
+            self._held.pop(id(checkout), None)
+            self.in_use -= 1
+            if by_gc:
+                self.gc_returns += 1
+
+    def leaks(self, threshold):
+        """Return (seconds held, call site) of objects held longer than threshold, longest first"""
+        now = _now()
+        with self._lock:
+            held = list(self._held.values())
+        return sorted(((now - since, site) for since, site in held if now - since > threshold), reverse=True)
+
+    @staticmethod
+    def _call_site():
+        frame = sys._getframe(1)
+        here = frame.f_code.co_filename
+        while frame is not None and frame.f_code.co_filename == here:
+            frame = frame.f_back
+        if frame is None:
+            return '<unknown>'
+        return '{}:{} in {}'.format(frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+
+
+class HealthCheckedQueue(queue.Queue):
+    """A queue.Queue which only keeps healthy objects.
+
+    validate_on_borrow/validate_on_return are called with an object and must
+    return True to keep it, an exception counts as a failed check. Objects
+    idle in the queue for more than idle_timeout seconds, or created more
+    than max_age seconds ago, are dropped as well. Every dropped object is
+    passed to dispose. When the queue is empty and a factory is given, get()
+    creates a new object instead of waiting.
+
+    maxsize caps the objects idle in the queue plus those checked out, so
+    with a factory get() waits once maxsize objects are in use. put() never
+    blocks, returning an object must not wait for another one.
+    """
+
+    def __init__(self, maxsize=0, factory=None, validate_on_borrow=None, validate_on_return=None,
+                 idle_timeout=None, max_age=None, dispose=None):
+        queue.Queue.__init__(self, maxsize)
+        self.factory = factory
+        self.validate_on_borrow = validate_on_borrow
+        self.validate_on_return = validate_on_return
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.dispose = dispose
+        # id -> (object, creation time) of the objects checked out, the
+        # reference keeps the id from being reused by another object
+        self._born = {}
+        # objects checked out or being created
+        self._out = 0
+        self._reaper = None
+        self._reaper_stop = threading.Event()
+
+    # queue.Queue hooks, called with self.mutex held.
+    # Every entry remembers when its object was created and when it was
+    # put back, to find aged and idle objects.
+    def _put(self, entry):
+        self.queue.append(entry)
+
+    def _get(self):
+        return self.queue.popleft()
+
+    def get(self, block=True, timeout=None):
+        deadline = None if timeout is None else _now() + timeout
+        while True:
+            with self.not_empty:
+                while not self._qsize() and not self._can_create():
+                    remaining = None if deadline is None else deadline - _now()
+                    if not block or (remaining is not None and remaining <= 0):
+                        raise queue.Empty
+                    self.not_empty.wait(remaining)
+                self._out += 1
+                entry = self._get() if self._qsize() else None
+            if entry is None:
+                try:
+                    item = self.factory()
+                except Exception:
+                    self._release()
+                    raise
+                born = _now()
+            else:
+                item, born, returned_at = entry
+                if self._is_stale(born, returned_at) or not self._check(self.validate_on_borrow, item):
+                    self._release()
+                    self._discard(item)
+                    continue
+            with self.mutex:
+                self._born[id(item)] = (item, born)
+            return item
+
+    def put(self, item, block=True, timeout=None):
+        """Return an object, block and timeout are accepted for compatibility only"""
+        with self.mutex:
+            checked_out = self._born.pop(id(item), None)
+        # objects which were never checked out are new to the queue
+        born = _now() if checked_out is None else checked_out[1]
+        if self._is_stale(born) or not self._check(self.validate_on_return, item):
+            if checked_out is not None:
+                self._release()
+            self._discard(item)
+            return
+        with self.not_empty:
+            if checked_out is not None:
+                self._out -= 1
+            self._put((item, born, _now()))
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def reap(self):
+        """Drop idle and aged objects from the queue, return how many were dropped"""
+        with self.mutex:
+            entries = list(self.queue)
+            self.queue.clear()
+            dropped = []
+            for item, born, returned_at in entries:
+                if self._is_stale(born, returned_at):
+                    dropped.append(item)
+                else:
+                    self.queue.append((item, born, returned_at))
+            if dropped:
+                # waiters may create replacements now
+                self.not_empty.notify(len(dropped))
+        for item in dropped:
+            self._discard(item)
+        return len(dropped)
+
+    def start_reaper(self, interval=1.0):
+        """Call reap() every interval seconds from a daemon thread"""
+        if self._reaper is not None:
+            return
+        self._reaper_stop.clear()
+        self._reaper = threading.Thread(target=self._reap_forever, args=(interval,))
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def stop_reaper(self):
+        if self._reaper is None:
+            return
+        self._reaper_stop.set()
+        self._reaper.join()
+        self._reaper = None
+
+    def _reap_forever(self, interval):
+        while not self._reaper_stop.wait(interval):
+            self.reap()
+
+    def _is_stale(self, born, returned_at=None):
+        now = _now()
+        if self.max_age is not None and now - born > self.max_age:
+            return True
+        return returned_at is not None and self.idle_timeout is not None and now - returned_at > self.idle_timeout
+
+    def _can_create(self):
+        return self.factory is not None and (self.maxsize <= 0 or self._qsize() + self._out < self.maxsize)
+
+    def _release(self):
+        """A checked out object is gone, a waiter may create a new one"""
+        with self.not_empty:
+            self._out -= 1
+            self.not_empty.notify()
+
+    @staticmethod
+    def _check(validate, item):
+        if validate is None:
+            return True
+        try:
+            return bool(validate(item))
+        except Exception:
+            return False
+
+    def _discard(self, item):
+        if self.dispose is not None:
+            try:
+                self.dispose(item)
+            except Exception:
+                pass
+
+
+class ShardedQueue(object):
+    """A replacement for queue.Queue with one lock per shard instead of one per queue.
+
+    Every thread gets a home shard (threads are spread round robin), returns
+    objects to it and takes objects from it first, so threads mostly touch
+    their own shard. Only when the home shard is empty a thread steals from
+    its sibling shards, and only when all of them are empty it waits.
+    """
+
+    def __init__(self, shards=None):
+        if shards is None:
+            shards = multiprocessing.cpu_count()
+        self._shards = [collections.deque() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._local = threading.local()
+        self._next_home = itertools.count()
+        self._not_empty = threading.Condition(threading.Lock())
+        self._waiting = 0
+
+    def qsize(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def put(self, item, block=True, timeout=None):
+        home = self._home()
+        with self._locks[home]:
+            self._shards[home].append(item)
+        # a waiter registers itself before its last look at the shards,
+        # so either it sees the item or we see it waiting
+        if self._waiting:
+            with self._not_empty:
+                self._not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+        home = self._home()
+        item = self._take(home)
+        if item is not _EMPTY:
+            return item
+        if not block:
+            raise queue.Empty
+        deadline = None if timeout is None else _now() + timeout
+        with self._not_empty:
+            self._waiting += 1
+            try:
+                while True:
+                    item = self._take(home)
+                    if item is not _EMPTY:
+                        return item
+                    remaining = None if deadline is None else deadline - _now()
+                    if remaining is not None and remaining <= 0:
+                        raise queue.Empty
+                    self._not_empty.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+    def _home(self):
+        try:
+            return self._local.home
+        except AttributeError:
+            self._local.home = next(self._next_home) % len(self._shards)
+            return self._local.home
+
+    def _take(self, home):
+        count = len(self._shards)
+        for offset in range(count):
+            index = (home + offset) % count
+            shard = self._shards[index]
+            if not shard:
+                continue
+            with self._locks[index]:
+                if shard:
+                    # LIFO, the most recently used object is the warmest one
+                    return shard.pop()
+        return _EMPTY
+
+
+_EMPTY = object()
+
+
+class SharedBudgetQueue(object):
+    """A replacement for queue.Queue which caps the objects of all processes.
+
+    Create it before forking the workers. Each process builds its own objects
+    with factory, but every object needs a slot from a process shared
+    semaphore first, so no more than budget objects exist across all worker
+    processes together. Returned objects stay in the process (at most
+    max_idle of them, the rest is disposed and its slot freed for the other
+    processes).
+
+    The slots each process holds are counted per pid in shared memory, room
+    is made for max_processes pids. A worker which dies without close() (it
+    is killed, runs out of memory or is recycled by the master) can't give
+    its slots back, so the master should call reclaim() after it reaped a
+    worker. A pid reused by a new process before reclaim() keeps the slots.
+    """
+
+    def __init__(self, budget, factory, max_idle=1, dispose=None, max_processes=64):
+        self.budget = budget
+        self.factory = factory
+        self.max_idle = max_idle
+        self.dispose = dispose
+        self._slots = multiprocessing.BoundedSemaphore(budget)
+        # pid, slot count, pid, slot count, ... a pid of 0 is a free entry
+        self._leases = multiprocessing.Array('i', 2 * max_processes)
+        self._pid = os.getpid()
+        self._idle = collections.deque()
+
+    def leased(self):
+        """Number of slots taken by all processes"""
+        with self._leases.get_lock():
+            return sum(self._leases[1::2])
+
+    def qsize(self):
+        return len(self._local_idle())
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def get(self, block=True, timeout=None):
+        idle = self._local_idle()
+        try:
+            return idle.pop()
+        except IndexError:
+            pass
+        if not self._slots.acquire(block, timeout):
+            raise queue.Empty
+        try:
+            self._lease(1)
+            try:
+                return self.factory()
+            except Exception:
+                self._lease(-1)
+                raise
+        except Exception:
+            self._slots.release()
+            raise
+
+    def put(self, item, block=True, timeout=None):
+        idle = self._local_idle()
+        if len(idle) < self.max_idle:
+            idle.append(item)
+            return
+        if self.dispose is not None:
+            self.dispose(item)
+        self._lease(-1)
+        self._slots.release()
+
+    def close(self):
+        """Give the slots of this process' idle objects back, call it before a worker exits"""
+        idle = self._local_idle()
+        max_idle, self.max_idle = self.max_idle, 0
+        try:
+            while idle:
+                self.put(idle.pop())
+        finally:
+            self.max_idle = max_idle
+
+    def reclaim(self):
+        """Free the slots of processes which are gone, return how many were freed"""
+        freed = 0
+        with self._leases.get_lock():
+            leases = self._leases
+            for index in range(0, len(leases), 2):
+                if leases[index] and not _alive(leases[index]):
+                    freed += leases[index + 1]
+                    leases[index] = leases[index + 1] = 0
+        for _ in range(freed):
+            self._slots.release()
+        return freed
+
+    def _lease(self, count):
+        pid = os.getpid()
+        with self._leases.get_lock():
+            leases = self._leases
+            pids = leases[::2]
+            if pid in pids:
+                index = 2 * pids.index(pid)
+            elif 0 in pids:
+                index = 2 * pids.index(0)
+                leases[index] = pid
+            else:
+                raise RuntimeError('More than {} processes hold slots'.format(len(pids)))
+            leases[index + 1] += count
+            if not leases[index + 1]:
+                leases[index] = 0
+
+    def _local_idle(self):
+        # idle objects inherited through fork belong to the parent and its slots
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = collections.deque()
+        return self._idle
+
+
+def _alive(pid):
     try:
-        import queue
-    except ImportError:  # python 2.x compatibility
-        import Queue as queue
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
 
+def benchmark(thread_counts=(1, 2, 4, 8), operations=100000, objects=64):
+    """Compare acquire/release throughput of queue.Queue and ShardedQueue"""
+    def worker(pool_queue, count):
+        for _ in range(count):
+            with ObjectPool(pool_queue):
+                pass
+
+    for threads in thread_counts:
+        for pool_queue in (queue.Queue(), ShardedQueue(shards=threads)):
+            for obj in range(objects):
+                pool_queue.put(obj)
+            workers = [threading.Thread(target=worker, args=(pool_queue, operations // threads))
+                       for _ in range(threads)]
+            start = _now()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = _now() - start
+            print('{:>2} threads {:<12} {:>10.0f} acquire/release per second'.format(
+                threads, type(pool_queue).__name__, operations / elapsed))
+
+
+def main():
     def test_object(queue):
         pool = ObjectPool(queue, True)
         print('Inside func: {}'.format(pool.item))
@@ -79,7 +557,10 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        main()
 
 ### OUTPUT ###
 # Inside with: yam
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+*What is this pattern about?
+This is the Object Pool from pool.py for asyncio code. ObjectPool waits on
+queue.Queue.get(), which blocks the whole event loop until an object is
+returned by another thread - and in a single threaded asyncio service that
+never happens.
+
+*What does this example do?
+AsyncObjectPool keeps the idle objects in a deque and the tasks waiting for
+one in a second deque of futures. put() hands a returned object straight to
+the first waiter, so a task never has to wake up just to find the object
+taken by someone else. If a waiting task is cancelled after an object was
+already handed to it, the object goes back to the pool instead of being lost.
+
+As with queue.Queue, maxsize=0 means the pool is unbounded. With a factory
+the pool creates objects on demand until it owns maxsize of them, after that
+callers wait for an object to be returned.
+
+*TL;DR
+Stores a set of initialized objects kept ready to use, without blocking the event loop.
+"""
+
+import asyncio
+import collections
+import time
+
+
+class AsyncObjectPool(object):
+    def __init__(self, items=(), factory=None, maxsize=0):
+        self._items = collections.deque(items)
+        self._waiters = collections.deque()
+        self._factory = factory
+        self._maxsize = maxsize
+        self._size = len(self._items)
+
+    def qsize(self):
+        return len(self._items)
+
+    def empty(self):
+        return not self._items
+
+    def put(self, item):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(item)
+                return
+        self._items.append(item)
+
+    async def get(self):
+        if self._items:
+            return self._items.popleft()
+        if self._factory is not None and (self._maxsize <= 0 or self._size < self._maxsize):
+            item = self._factory()
+            self._size += 1
+            return item
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # put() already handed us an object, give it to the next one
+                self.put(waiter.result())
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+
+    def checkout(self):
+        return _Checkout(self)
+
+
+class _Checkout(object):
+    """async with counterpart of ObjectPool"""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self.item = None
+
+    async def __aenter__(self):
+        self.item = await self._pool.get()
+        return self.item
+
+    async def __aexit__(self, Type, value, traceback):
+        if self.item is not None:
+            self._pool.put(self.item)
+            self.item = None
+
+
+def benchmark(tasks=10000, size=100, rounds=10):
+    """Acquire/release throughput with many more tasks than pooled objects"""
+    pool = AsyncObjectPool(range(size))
+
+    async def worker():
+        for _ in range(rounds):
+            async with pool.checkout():
+                await asyncio.sleep(0)
+
+    async def run():
+        await asyncio.gather(*(worker() for _ in range(tasks)))
+
+    loop = asyncio.new_event_loop()
+    try:
+        start = time.perf_counter()
+        loop.run_until_complete(run())
+        elapsed = time.perf_counter() - start
+    finally:
+        loop.close()
+    assert pool.qsize() == size
+    print('{} tasks, {} objects: {:.0f} acquire/release per second'.format(tasks, size, tasks * rounds / elapsed))
+
+
+def main():
+    """
+    >>> loop = asyncio.new_event_loop()
+
+    >>> pool = AsyncObjectPool(['yam'])
+    >>> async def use(pool):
+    ...     async with pool.checkout() as obj:
+    ...         print('Inside with: {}'.format(obj))
+    >>> loop.run_until_complete(use(pool))
+    Inside with: yam
+    >>> pool.qsize()
+    1
+
+    # A cancelled waiter does not lose the object it was about to receive
+    >>> async def cancelled_waiter(pool):
+    ...     obj = await pool.get()
+    ...     waiter = asyncio.ensure_future(pool.get())
+    ...     await asyncio.sleep(0)
+    ...     pool.put(obj)
+    ...     waiter.cancel()
+    ...     await asyncio.sleep(0)
+    ...     return waiter.cancelled(), pool.qsize()
+    >>> loop.run_until_complete(cancelled_waiter(pool))
+    (True, 1)
+
+    # With a factory the pool grows up to maxsize
+    >>> sized_pool = AsyncObjectPool(factory=list, maxsize=2)
+    >>> async def exhaust(pool):
+    ...     first, second = await pool.get(), await pool.get()
+    ...     try:
+    ...         await asyncio.wait_for(pool.get(), 0.01)
+    ...     except asyncio.TimeoutError:
+    ...         print('Pool exhausted')
+    >>> loop.run_until_complete(exhaust(sized_pool))
+    Pool exhausted
+
+    # A failing factory does not use up a slot
+    >>> attempts = []
+    >>> def connect():
+    ...     attempts.append(None)
+    ...     if len(attempts) == 1:
+    ...         raise ConnectionError('refused')
+    ...     return 'connection'
+    >>> flaky_pool = AsyncObjectPool(factory=connect, maxsize=1)
+    >>> loop.run_until_complete(flaky_pool.get())
+    Traceback (most recent call last):
+    ...
+    ConnectionError: refused
+    >>> loop.run_until_complete(asyncio.wait_for(flaky_pool.get(), 1))
+    'connection'
+
+    >>> loop.close()
+    """
+
+
+if __name__ == '__main__':
+    import sys
+
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        import doctest
+        doctest.testmod()
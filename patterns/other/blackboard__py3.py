@@ -10,39 +10,509 @@ In this way, the sub-systems work together to solve the problem,
 where the solution is the sum of its parts.
 
 https://en.wikipedia.org/wiki/Blackboard_system
+
+Controller asks every expert in turn whether it wants to contribute.
+AgendaController keeps the eager experts in a priority queue instead and
+only asks an expert again when a common_state key it depends on changed.
+ParallelController lets all eager experts contribute at once on a thread
+or process pool, each to its own copy of common_state, and merges their
+changes in a deterministic way.
+
+Contributions are recorded in an append-only ContributionLog, which keeps
+the totals and per expert counts up to date and can be replayed.
+
+Every controller takes profile=True to record a RunProfile of run_loop:
+how often each expert was asked and was eager, how often it contributed,
+the progress and the time of its contributions, and the loop iterations.
+The summary is printed by Controller.report() when run_loop is done.
 """
 
 import abc
+import collections
+import copy
+import heapq
 import random
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BlackboardState(dict):
+    """common_state which remembers the keys written or removed since take_changes()
+
+    >>> state = BlackboardState(problems=0)
+    >>> state.update(problems=1, progress=5)
+    >>> _ = state.setdefault('suggestions', 0)
+    >>> sorted(state.take_changes())
+    ['problems', 'progress', 'suggestions']
+    >>> _ = state.pop('progress')
+    >>> del state['suggestions']
+    >>> sorted(state.take_changes()), state
+    (['progress', 'suggestions'], {'problems': 1})
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.changed = set()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.changed.add(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.changed.add(key)
+
+    # the other ways to change a dict go through the two above
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self:
+            return super().pop(key, *default)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        key, value = super().popitem()
+        self.changed.add(key)
+        return key, value
+
+    def clear(self):
+        self.changed.update(self)
+        super().clear()
+
+    def take_changes(self):
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def __reduce__(self):
+        # pickle and copy would call __setitem__ before __init__ otherwise
+        return type(self), (dict(self),)
+
+
+Contribution = collections.namedtuple('Contribution', 'expert problems suggestions progress')
+
+
+class ContributionLog(object):
+    """Append-only log of contributions, stored column by column.
+
+    Expert names are stored once and referred to by number. Totals and
+    counts per expert are updated on append, so reading them is free.
+    A column holds integers until the first float is added to it, then it
+    holds floats.
+
+    >>> log = ContributionLog()
+    >>> log.append('Student', problems=3, progress=1)
+    >>> log.append('Professor', suggestions=10, progress=50)
+    >>> log.append('Student', problems=1, progress=2)
+    >>> len(log), log.experts(), log.counts()
+    (3, ['Student', 'Professor', 'Student'], {'Student': 2, 'Professor': 1})
+    >>> log.totals
+    {'problems': 4, 'suggestions': 10, 'progress': 53}
+    >>> list(log.replay(start=2))
+    [Contribution(expert='Student', problems=1, suggestions=0, progress=2)]
+    >>> log.append('Student', progress=0.5)
+    >>> log.totals['progress'], log[0].progress
+    (53.5, 1.0)
+    """
+
+    _fields = ('problems', 'suggestions', 'progress')
+
+    def __init__(self):
+        self._names = []
+        self._ids = {}
+        self._counts = []
+        self._experts = array('H')
+        self._columns = {field: array('q') for field in self._fields}
+        self.totals = {field: 0 for field in self._fields}
+
+    def append(self, expert, problems=0, suggestions=0, progress=0):
+        expert_id = self._ids.get(expert)
+        if expert_id is None:
+            expert_id = self._ids[expert] = len(self._names)
+            self._names.append(expert)
+            self._counts.append(0)
+        self._experts.append(expert_id)
+        self._counts[expert_id] += 1
+        for field, value in zip(self._fields, (problems, suggestions, progress)):
+            column = self._columns[field]
+            try:
+                column.append(value)
+            except TypeError:
+                if column.typecode != 'q':
+                    raise
+                column = self._columns[field] = array('d', column)
+                column.append(value)
+            self.totals[field] += value
+
+    def extend(self, contributions):
+        for contribution in contributions:
+            self.append(*contribution)
+
+    def __len__(self):
+        return len(self._experts)
+
+    def __getitem__(self, index):
+        columns = self._columns
+        return Contribution(
+            self._names[self._experts[index]],
+            columns['problems'][index],
+            columns['suggestions'][index],
+            columns['progress'][index],
+        )
+
+    def replay(self, start=0):
+        """Yield the contributions from start on, e.g. to rebuild a state"""
+        for index in range(start, len(self)):
+            yield self[index]
+
+    __iter__ = replay
+
+    def experts(self):
+        return [self._names[expert_id] for expert_id in self._experts]
+
+    def counts(self):
+        return dict(zip(self._names, self._counts))
 
 
 class Blackboard(object):
     def __init__(self):
         self.experts = []
-        self.common_state = {
+        self.log = ContributionLog()
+        self.common_state = BlackboardState({
             'problems': 0,
             'suggestions': 0,
-            'contributions': [],
             'progress': 0,  # percentage, if 100 -> task is finished
-        }
+        })
 
     def add_expert(self, expert):
         self.experts.append(expert)
 
+    def contribute(self, expert, problems=0, suggestions=0, progress=0):
+        """Record a contribution of the expert named expert and apply it to common_state"""
+        self.log.append(expert, problems, suggestions, progress)
+        state = self.common_state
+        state['problems'] += problems
+        state['suggestions'] += suggestions
+        state['progress'] += progress
+
+    @property
+    def contributions(self):
+        return self.log.experts()
+
+
+class ExpertStats(object):
+    __slots__ = ('name', 'checks', 'eager', 'contributions', 'progress', 'time')
+
+    def __init__(self, name):
+        self.name = name
+        self.checks = 0
+        self.eager = 0
+        self.contributions = 0
+        self.progress = 0
+        self.time = 0.0
+
+
+class RunProfile(object):
+    """What the experts did during one run_loop, stats are in the order of the experts"""
+
+    def __init__(self, experts):
+        self.stats = [ExpertStats(type(expert).__name__) for expert in experts]
+        self.iterations = 0
+        self.wall_time = 0.0
+
+    def summary(self):
+        lines = [
+            '{} iterations in {:.3f} ms'.format(self.iterations, self.wall_time * 1000),
+            '{:<12} {:>6} {:>6} {:>13} {:>8} {:>8}'.format(
+                'expert', 'checks', 'eager', 'contributions', 'progress', 'time ms'),
+        ]
+        for stats in self.stats:
+            lines.append('{:<12} {:>6} {:>6} {:>13} {:>8} {:>8.3f}'.format(
+                stats.name, stats.checks, stats.eager, stats.contributions, stats.progress, stats.time * 1000))
+        return '\n'.join(lines)
+
 
 class Controller(object):
-    def __init__(self, blackboard):
+    """Asks every expert in turn until the task is finished.
+
+    >>> class Counter(AbstractExpert):
+    ...     is_eager_to_contribute = True
+    ...     def contribute(self):
+    ...         self.blackboard.contribute('Counter', progress=25)
+    >>> class Idler(AbstractExpert):
+    ...     is_eager_to_contribute = False
+    ...     def contribute(self):
+    ...         pass
+    >>> blackboard = Blackboard()
+    >>> blackboard.add_expert(Counter(blackboard))
+    >>> blackboard.add_expert(Idler(blackboard))
+    >>> controller = Controller(blackboard, profile=True)
+    >>> controller.run_loop()  # doctest: +ELLIPSIS +NORMALIZE_WHITESPACE
+    4 iterations in ... ms
+    expert       checks  eager  contributions  progress  time ms
+    Counter           4      4              4       100  ...
+    Idler             4      0              0         0  ...
+    ['Counter', 'Counter', 'Counter', 'Counter']
+    """
+
+    def __init__(self, blackboard, profile=False):
         self.blackboard = blackboard
+        self.profiling = profile
+        # RunProfile of the last run_loop
+        self.profile = None
 
     def run_loop(self):
+        self._start_profile()
         while self.blackboard.common_state['progress'] < 100:
-            for expert in self.blackboard.experts:
-                if expert.is_eager_to_contribute:
-                    expert.contribute()
-        return self.blackboard.common_state['contributions']
+            if self.profile is not None:
+                self.profile.iterations += 1
+            for index, expert in enumerate(self.blackboard.experts):
+                if self._is_eager(index, expert):
+                    self._contribute(index, expert)
+        self._finish_profile()
+        return self.blackboard.contributions
+
+    def report(self, profile):
+        """Called with the RunProfile at the end of run_loop"""
+        print(profile.summary())
+
+    def _start_profile(self):
+        if self.profiling:
+            self.profile = RunProfile(self.blackboard.experts)
+            self._started = time.perf_counter()
+
+    def _finish_profile(self):
+        if self.profile is not None:
+            self.profile.wall_time = time.perf_counter() - self._started
+            self.report(self.profile)
+
+    def _is_eager(self, index, expert):
+        eager = expert.is_eager_to_contribute
+        if self.profile is not None:
+            stats = self.profile.stats[index]
+            stats.checks += 1
+            stats.eager += bool(eager)
+        return eager
+
+    def _contribute(self, index, expert):
+        if self.profile is None:
+            expert.contribute()
+            return
+        progress = self.blackboard.common_state['progress']
+        start = time.perf_counter()
+        expert.contribute()
+        self._record(index, time.perf_counter() - start, self.blackboard.common_state['progress'] - progress)
+
+    def _record(self, index, elapsed, progress):
+        stats = self.profile.stats[index]
+        stats.contributions += 1
+        stats.progress += progress
+        stats.time += elapsed
+
+
+class AgendaController(Controller):
+    """Lets one eager expert contribute at a time, picked from an agenda.
+
+    The expert which contributed least so far goes first, ties are broken
+    by priority (higher first) and then by the order experts were added.
+    After a contribution only the experts whose depends_on keys changed
+    (and those with depends_on = None) are asked again whether they are eager.
+
+    >>> class Counter(AbstractExpert):
+    ...     depends_on = ()
+    ...     is_eager_to_contribute = True
+    ...     def contribute(self):
+    ...         self.blackboard.contribute('Counter', progress=10)
+    >>> class Finisher(AbstractExpert):
+    ...     depends_on = ('progress',)
+    ...     checks = 0
+    ...     @property
+    ...     def is_eager_to_contribute(self):
+    ...         Finisher.checks += 1
+    ...         return self.blackboard.common_state['progress'] >= 50
+    ...     def contribute(self):
+    ...         progress = self.blackboard.common_state['progress']
+    ...         self.blackboard.contribute('Finisher', progress=100 - progress)
+    >>> blackboard = Blackboard()
+    >>> blackboard.add_expert(Counter(blackboard))
+    >>> blackboard.add_expert(Finisher(blackboard))
+    >>> AgendaController(blackboard).run_loop()
+    ['Counter', 'Counter', 'Counter', 'Counter', 'Counter', 'Finisher']
+    >>> blackboard.common_state['progress'], Finisher.checks
+    (100, 7)
+    """
+
+    def run_loop(self):
+        state = self.blackboard.common_state
+        experts = self.blackboard.experts
+        turns = [0] * len(experts)
+        versions = [0] * len(experts)
+        agenda = []
+
+        def refresh(index):
+            # entries pushed before this one become outdated
+            versions[index] += 1
+            if self._is_eager(index, experts[index]):
+                entry = (turns[index], -experts[index].priority, index, versions[index])
+                heapq.heappush(agenda, entry)
+
+        volatile = [index for index, expert in enumerate(experts) if expert.depends_on is None]
+        self._start_profile()
+        state.take_changes()
+        for index in range(len(experts)):
+            refresh(index)
+
+        while state['progress'] < 100:
+            if self.profile is not None:
+                self.profile.iterations += 1
+            while agenda and agenda[0][3] != versions[agenda[0][2]]:
+                heapq.heappop(agenda)
+            if not agenda:
+                if not volatile:
+                    raise RuntimeError('No expert is eager to contribute')
+                for index in volatile:
+                    refresh(index)
+                continue
+
+            index = heapq.heappop(agenda)[2]
+            self._contribute(index, experts[index])
+            turns[index] += 1
+
+            changed = state.take_changes()
+            stale = set(volatile)
+            stale.add(index)
+            stale.update(
+                other for other, expert in enumerate(experts)
+                if expert.depends_on and changed.intersection(expert.depends_on)
+            )
+            for other in sorted(stale):
+                refresh(other)
+        self._finish_profile()
+        return self.blackboard.contributions
+
+
+def merge_changes(key, base, values):
+    """Default conflict resolution of ParallelController.
+
+    values are the new values of key from the experts which changed it, in
+    the order the experts were added. Numbers add up their changes, lists
+    get the items every expert appended, anything else takes the last value.
+    """
+    numbers = (int, float)
+    if isinstance(base, numbers) and all(isinstance(value, numbers) for value in values):
+        return base + sum(value - base for value in values)
+    if isinstance(base, list) and all(isinstance(value, list) and value[:len(base)] == base for value in values):
+        merged = list(base)
+        for value in values:
+            merged.extend(value[len(base):])
+        return merged
+    return values[-1]
+
+
+class ParallelController(Controller):
+    """Runs the eager experts of a round concurrently.
+
+    Every expert contributes to a copy of common_state taken at the start
+    of the round, so they don't see each other's changes. Their changes are
+    merged key by key with resolve(key, old value, new values), and their
+    log entries are appended in the order the experts were added. Pass a
+    ProcessPoolExecutor as executor for CPU heavy experts, they have to be
+    picklable then.
+
+    Each expert contributes as a shallow copy of itself. The attributes it
+    sets on itself are copied back to the expert after the round, like with
+    Controller. Objects changed in place are only shared with a thread pool.
+
+    >>> class Worker(AbstractExpert):
+    ...     is_eager_to_contribute = True
+    ...     turns = 0
+    ...     def __init__(self, blackboard, name):
+    ...         super().__init__(blackboard)
+    ...         self.name = name
+    ...     def contribute(self):
+    ...         self.turns += 1
+    ...         self.blackboard.contribute(self.name, progress=30)
+    >>> blackboard = Blackboard()
+    >>> blackboard.add_expert(Worker(blackboard, 'first'))
+    >>> blackboard.add_expert(Worker(blackboard, 'second'))
+    >>> ParallelController(blackboard).run_loop()
+    ['first', 'second', 'first', 'second']
+    >>> blackboard.common_state['progress'], [expert.turns for expert in blackboard.experts]
+    (120, [2, 2])
+    """
+
+    def __init__(self, blackboard, executor=None, resolve=merge_changes, profile=False):
+        super().__init__(blackboard, profile)
+        self.executor = executor
+        self.resolve = resolve
+
+    def run_loop(self):
+        executor = self.executor or ThreadPoolExecutor()
+        self._start_profile()
+        try:
+            state = self.blackboard.common_state
+            while state['progress'] < 100:
+                if self.profile is not None:
+                    self.profile.iterations += 1
+                eager = [
+                    (index, expert) for index, expert in enumerate(self.blackboard.experts)
+                    if self._is_eager(index, expert)
+                ]
+                snapshot = copy.deepcopy(dict(state))
+                detached = [_detached(expert, snapshot) for _, expert in eager]
+                results = list(executor.map(_contribute_to_copy, detached))
+                for (index, expert), (result_state, contributions, attributes, elapsed) in zip(eager, results):
+                    expert.__dict__.update(attributes)
+                    self.blackboard.log.extend(contributions)
+                    if self.profile is not None:
+                        self._record(index, elapsed, result_state['progress'] - snapshot['progress'])
+                states = [result[0] for result in results]
+                for key in snapshot.keys() | {key for result_state in states for key in result_state}:
+                    values = [
+                        result_state[key] for result_state in states
+                        if result_state.get(key) != snapshot.get(key)
+                    ]
+                    if values:
+                        state[key] = self.resolve(key, snapshot.get(key), values)
+        finally:
+            if self.executor is None:
+                executor.shutdown()
+        self._finish_profile()
+        return self.blackboard.contributions
+
+
+def _detached(expert, snapshot):
+    """A copy of expert working on its own blackboard with a copy of snapshot"""
+    blackboard = Blackboard()
+    blackboard.common_state = BlackboardState(copy.deepcopy(snapshot))
+    detached = copy.copy(expert)
+    detached.blackboard = blackboard
+    return detached
+
+
+def _contribute_to_copy(expert):
+    start = time.perf_counter()
+    expert.contribute()
+    elapsed = time.perf_counter() - start
+    attributes = {name: value for name, value in vars(expert).items() if name != 'blackboard'}
+    return dict(expert.blackboard.common_state), list(expert.blackboard.log), attributes, elapsed
 
 
 class AbstractExpert(metaclass=abc.ABCMeta):
+    # common_state keys is_eager_to_contribute looks at, None for "can change any time"
+    depends_on = None
+    # experts with a higher priority go first in AgendaController
+    priority = 0
 
     def __init__(self, blackboard):
         self.blackboard = blackboard
@@ -58,15 +528,19 @@ class AbstractExpert(metaclass=abc.ABCMeta):
 
 
 class Student(AbstractExpert):
+    depends_on = ()
+
     @property
     def is_eager_to_contribute(self):
         return True
 
     def contribute(self):
-        self.blackboard.common_state['problems'] += random.randint(1, 10)
-        self.blackboard.common_state['suggestions'] += random.randint(1, 10)
-        self.blackboard.common_state['contributions'] += [self.__class__.__name__]
-        self.blackboard.common_state['progress'] += random.randint(1, 2)
+        self.blackboard.contribute(
+            self.__class__.__name__,
+            problems=random.randint(1, 10),
+            suggestions=random.randint(1, 10),
+            progress=random.randint(1, 2),
+        )
 
 
 class Scientist(AbstractExpert):
@@ -75,22 +549,28 @@ class Scientist(AbstractExpert):
         return random.randint(0, 1)
 
     def contribute(self):
-        self.blackboard.common_state['problems'] += random.randint(10, 20)
-        self.blackboard.common_state['suggestions'] += random.randint(10, 20)
-        self.blackboard.common_state['contributions'] += [self.__class__.__name__]
-        self.blackboard.common_state['progress'] += random.randint(10, 30)
+        self.blackboard.contribute(
+            self.__class__.__name__,
+            problems=random.randint(10, 20),
+            suggestions=random.randint(10, 20),
+            progress=random.randint(10, 30),
+        )
 
 
 class Professor(AbstractExpert):
+    depends_on = ('problems',)
+
     @property
     def is_eager_to_contribute(self):
         return True if self.blackboard.common_state['problems'] > 100 else False
 
     def contribute(self):
-        self.blackboard.common_state['problems'] += random.randint(1, 2)
-        self.blackboard.common_state['suggestions'] += random.randint(10, 20)
-        self.blackboard.common_state['contributions'] += [self.__class__.__name__]
-        self.blackboard.common_state['progress'] += random.randint(10, 100)
+        self.blackboard.contribute(
+            self.__class__.__name__,
+            problems=random.randint(1, 2),
+            suggestions=random.randint(10, 20),
+            progress=random.randint(10, 100),
+        )
 
 
 if __name__ == '__main__':
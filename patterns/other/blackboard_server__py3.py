@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+*What is this pattern about?
+The Blackboard from blackboard__py3.py keeps common_state in a dict, so all
+experts have to live in the same process. Here the blackboard is served
+over a socket, so expensive experts can run in other processes or on other
+machines while they share one state.
+
+*What does this example do?
+BlackboardServer serves a Blackboard, one JSON message per line. It keeps
+a version number and remembers at which version every key changed last.
+
+RemoteBlackboard is the client side, a Blackboard whose common_state is a
+local copy of the served one. sync() fetches only the keys changed since
+the version it has seen. Contributions are made to the local copy and
+commit() sends the changed keys and the new log entries in one message,
+together with the version they are based on (optimistic versioning): the
+server rejects the commit if one of the keys changed in the meantime, and
+the client throws its changes away and fetches the current state instead.
+
+Keys updated by sync() and commit() are reported by take_changes() like
+local writes, so AgendaController re-checks the experts depending on them.
+The state dict is never replaced, controllers may hold on to it.
+
+RemoteExpert is the AbstractExpert proxy, add_expert() wraps every expert
+in one. It syncs before the expert is asked whether it is eager and
+commits after it contributed, trying again on a conflict. With batch > 1
+the expert contributes several times before one commit.
+
+The server runs on localhost at a free port by default, so the same code
+works with a stand-in server in a thread of the test process.
+
+*TL;DR
+Shares one blackboard between experts in different processes, state changes travel as versioned diffs.
+"""
+
+import json
+import socket
+import socketserver
+import threading
+
+try:
+    from patterns.other.blackboard__py3 import AbstractExpert, Blackboard, BlackboardState, Contribution, Controller
+except ImportError:  # run as a script, e.g. by run_all.sh
+    from blackboard__py3 import AbstractExpert, Blackboard, BlackboardState, Contribution, Controller
+
+
+class BlackboardServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, blackboard, address=('localhost', 0)):
+        super().__init__(address, _BlackboardHandler)
+        self.blackboard = blackboard
+        self.version = 0
+        self._changed_at = {key: 0 for key in blackboard.common_state}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Serve from a daemon thread"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def sync(self, since):
+        with self._lock:
+            return {'version': self.version, 'changes': self._changes_since(since)}
+
+    def commit(self, base, changes, contributions):
+        with self._lock:
+            if any(self._changed_at.get(key, -1) > base for key in changes):
+                return {'ok': False, 'version': self.version}
+            self.version += 1
+            state = self.blackboard.common_state
+            for key, value in changes.items():
+                state[key] = value
+                self._changed_at[key] = self.version
+            self.blackboard.log.extend(contributions)
+            return {'ok': True, 'version': self.version, 'changes': self._changes_since(base)}
+
+    def _changes_since(self, version):
+        state = self.blackboard.common_state
+        return {key: state[key] for key, changed in self._changed_at.items() if changed > version}
+
+
+class _BlackboardHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            request = json.loads(line.decode('utf-8'))
+            if request['op'] == 'sync':
+                response = self.server.sync(request['since'])
+            elif request['op'] == 'commit':
+                response = self.server.commit(request['base'], request['changes'], request['contributions'])
+            else:
+                response = {'error': 'unknown op {!r}'.format(request['op'])}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class _RemoteState(BlackboardState):
+    """common_state of a RemoteBlackboard, local holds the keys written since the last commit"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.local = set()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.local.add(key)
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+
+class RemoteBlackboard(Blackboard):
+    """Local copy of a served blackboard, log holds the contributions committed from here"""
+
+    def __init__(self, address):
+        super().__init__()
+        self.version = -1
+        self.conflicts = 0
+        self._pending = []
+        self._connection = socket.create_connection(address)
+        self._file = self._connection.makefile('rwb')
+        self.common_state = _RemoteState()
+        self.sync()
+
+    def add_expert(self, expert):
+        super().add_expert(expert if isinstance(expert, RemoteExpert) else RemoteExpert(self, expert))
+
+    def contribute(self, expert, problems=0, suggestions=0, progress=0):
+        self._pending.append(Contribution(expert, problems, suggestions, progress))
+        # keys which don't change are left out of the diff, and of conflicts
+        state = self.common_state
+        for key, delta in (('problems', problems), ('suggestions', suggestions), ('progress', progress)):
+            if delta:
+                state[key] += delta
+
+    def sync(self):
+        """Fetch the keys changed since the last sync"""
+        if self._pending or self.common_state.local:
+            raise RuntimeError('Commit the local changes before syncing')
+        response = self._request({'op': 'sync', 'since': self.version})
+        self._apply(response)
+
+    def commit(self):
+        """Send the local changes, False if they conflicted and were thrown away"""
+        changes, self.common_state.local = self.common_state.local, set()
+        response = self._request({
+            'op': 'commit',
+            'base': self.version,
+            'changes': {key: self.common_state[key] for key in changes},
+            'contributions': self._pending,
+        })
+        pending, self._pending = self._pending, []
+        if not response['ok']:
+            self.conflicts += 1
+            self.version = -1
+            # cleared in place, controllers keep a reference to the dict
+            dict.clear(self.common_state)
+            self.sync()
+            return False
+        self.log.extend(pending)
+        self._apply(response)
+        return True
+
+    def close(self):
+        self._file.close()
+        self._connection.close()
+
+    def _request(self, message):
+        self._file.write(json.dumps(message).encode('utf-8') + b'\n')
+        self._file.flush()
+        return json.loads(self._file.readline().decode('utf-8'))
+
+    def _apply(self, response):
+        state = self.common_state
+        for key, value in response['changes'].items():
+            # a change for take_changes(), but not one to commit
+            dict.__setitem__(state, key, value)
+            state.changed.add(key)
+        self.version = response['version']
+
+
+class RemoteExpert(AbstractExpert):
+    """Proxy of an expert working on a RemoteBlackboard"""
+
+    def __init__(self, blackboard, expert, batch=1, retries=10):
+        super().__init__(blackboard)
+        self.expert = expert
+        self.batch = batch
+        self.retries = retries
+
+    @property
+    def depends_on(self):
+        return self.expert.depends_on
+
+    @property
+    def priority(self):
+        return self.expert.priority
+
+    @property
+    def is_eager_to_contribute(self):
+        self.blackboard.sync()
+        return self.expert.is_eager_to_contribute
+
+    def contribute(self):
+        for _ in range(self.retries):
+            self.expert.contribute()
+            for _ in range(self.batch - 1):
+                if not self.expert.is_eager_to_contribute:
+                    break
+                self.expert.contribute()
+            if self.blackboard.commit():
+                return
+            # another expert changed the same keys, try again on the current state
+            if not self.expert.is_eager_to_contribute:
+                return
+        raise RuntimeError('Too many conflicting commits')
+
+
+def work(address, *expert_classes):
+    """Run experts against the served blackboard until it is done, e.g. in a worker process"""
+    blackboard = RemoteBlackboard(address)
+    try:
+        for expert_class in expert_classes:
+            blackboard.add_expert(expert_class(blackboard))
+        return Controller(blackboard).run_loop()
+    finally:
+        blackboard.close()
+
+
+class Counter(AbstractExpert):
+    @property
+    def is_eager_to_contribute(self):
+        return self.blackboard.common_state['progress'] < 100
+
+    def contribute(self):
+        self.blackboard.contribute('Counter', problems=1, progress=10)
+
+
+def main():
+    """
+    >>> server = BlackboardServer(Blackboard()).start()
+    >>> first = RemoteBlackboard(server.server_address)
+    >>> second = RemoteBlackboard(server.server_address)
+
+    >>> first.contribute('Student', problems=5, progress=10)
+    >>> first.commit()
+    True
+
+    # second still works on version 0, its commit conflicts
+    >>> second.contribute('Scientist', progress=20)
+    >>> second.commit()
+    False
+    >>> second.version, second.common_state['progress']
+    (1, 10)
+    >>> second.contribute('Scientist', progress=20)
+    >>> second.commit()
+    True
+    >>> server.blackboard.common_state['progress'], server.blackboard.contributions
+    (30, ['Student', 'Scientist'])
+    >>> first.sync()
+    >>> first.common_state['progress']
+    30
+    >>> first.close()
+    >>> second.close()
+    >>> server.stop()
+
+    # Four workers share the work, a ProcessPoolExecutor would do as well
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> server = BlackboardServer(Blackboard()).start()
+    >>> with ThreadPoolExecutor(4) as executor:
+    ...     results = list(executor.map(work, [server.server_address] * 4, [Counter] * 4))
+    >>> sum(len(contributions) for contributions in results)
+    10
+    >>> server.blackboard.common_state
+    {'problems': 10, 'suggestions': 0, 'progress': 100}
+    >>> server.stop()
+    """
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
@@ -16,6 +16,13 @@ The example below sets-up an 'object pool' which stores initialised
 objects. When a 'Card' is created it first checks to see if it already
 exists instead of creating a new one. This aims to reduce the number of
 objects initialised by the program.
+The pool lookup is lock free. Only when a card is missing the creating
+thread takes one of a few striped locks and looks again, so two threads
+creating the same card at once still end up with the same object.
+Cards still carry a __dict__ each (see `new_attr` below). SlottedCard
+shares the same pool logic but declares __slots__, which saves roughly
+30 bytes per instance (about 150 -> 120 bytes on CPython 3.11). That adds
+up when millions of cards are interned, but it is no order of magnitude.
 
 *References:
 http://codesnipers.com/?q=python-flyweights
@@ -28,6 +35,9 @@ https://docs.python.org/3/library/sys.html#sys.intern
 Minimizes memory usage by sharing data with other similar objects.
 """
 
+import sys
+import threading
+import tracemalloc
 import weakref
 
 
@@ -38,16 +48,23 @@ class Card(object):
     # With WeakValueDictionary garbage collection can reclaim the object
     # when there are no other references to it.
     _pool = weakref.WeakValueDictionary()
+    # Cards with different keys are usually created under different locks
+    _locks = [threading.Lock() for _ in range(16)]
 
     def __new__(cls, value, suit):
+        key = value + suit
         # If the object exists in the pool - just return it
-        obj = cls._pool.get(value + suit)
-        # otherwise - create new one (and add it to the pool)
+        obj = cls._pool.get(key)
         if obj is None:
-            obj = object.__new__(Card)
-            cls._pool[value + suit] = obj
-            # This row does the part we usually see in `__init__`
-            obj.value, obj.suit = value, suit
+            with cls._locks[hash(key) % len(cls._locks)]:
+                # another thread may have created it while we waited
+                obj = cls._pool.get(key)
+                # otherwise - create new one (and add it to the pool)
+                if obj is None:
+                    obj = object.__new__(cls)
+                    # This row does the part we usually see in `__init__`
+                    obj.value, obj.suit = value, suit
+                    cls._pool[key] = obj
         return obj
 
     # If you uncomment `__init__` and comment-out `__new__` -
@@ -59,6 +76,31 @@ class Card(object):
         return "<Card: %s%s>" % (self.value, self.suit)
 
 
+class SlottedCard(object):
+    """The Flyweight without a per-instance __dict__"""
+
+    # __weakref__ is needed to keep the instances in a WeakValueDictionary
+    __slots__ = ('value', 'suit', '__weakref__')
+    _pool = weakref.WeakValueDictionary()
+    _locks = [threading.Lock() for _ in range(16)]
+
+    __new__ = Card.__new__
+    __repr__ = Card.__repr__
+
+
+def benchmark(count=10 ** 6):
+    """Compare the memory taken by count distinct cards of each class"""
+    values = [str(number) for number in range(count)]
+    for card_class in (Card, SlottedCard):
+        tracemalloc.start()
+        cards = [card_class(value, 'h') for value in values]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('{:<12} {:>7.1f} MB, {:.0f} bytes per card'.format(
+            card_class.__name__, size / 2.0 ** 20, float(size) / len(cards)))
+        del cards
+
+
 def main():
     """
     >>> c1 = Card('9', 'h')
@@ -79,9 +121,28 @@ def main():
     >>> c4 = Card('9', 'h')
     >>> hasattr(c4, 'new_attr')
     False
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> with ThreadPoolExecutor(8) as executor:
+    ...     cards = list(executor.map(lambda _: Card('Q', 's'), range(100)))
+    >>> len(set(map(id, cards)))
+    1
+
+    >>> s1 = SlottedCard('9', 'h')
+    >>> s1, s1 is SlottedCard('9', 'h'), s1 is c4
+    (<Card: 9h>, True, False)
+    >>> hasattr(s1, '__dict__')
+    False
+    >>> s1.new_attr = 'temp'
+    Traceback (most recent call last):
+    ...
+    AttributeError: 'SlottedCard' object has no attribute 'new_attr'
     """
 
 
 if __name__ == "__main__":
-    import doctest
-    doctest.testmod()
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        import doctest
+        doctest.testmod()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+*What is this pattern about?
+The Flyweight from flyweight__py3.py shares intrinsic state between the
+objects of one process. Every worker process of a server still builds its
+own pool, so a large read-only vocabulary is duplicated once per process.
+
+*What does this example do?
+SharedFlyweightTable writes the immutable intrinsic state (strings) once
+into a multiprocessing.shared_memory segment. Other processes attach to the
+segment by name and get SharedFlyweight handles - a table and an index, two
+slots and no copy of the data. Requires python 3.8+.
+
+The values are stored sorted and without duplicates, so handle() finds a
+value by binary search in the segment itself. No process builds a private
+lookup dict, which would cost several times the size of the segment.
+
+Segment layout: the number of values, then one offset per value plus the
+end offset (all unsigned 32 bit ints), then the utf-8 encoded values in
+sorted order.
+
+*TL;DR
+Shares read-only flyweight data between processes instead of copying it into each.
+"""
+
+import struct
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python < 3.8
+    shared_memory = None
+
+_uint = struct.Struct('<I')
+
+
+class SharedFlyweightTable(object):
+    def __init__(self, segment, owner=False):
+        self._segment = segment
+        self._owner = owner
+        self._count = _uint.unpack_from(segment.buf, 0)[0]
+        self._data_start = _uint.size * (self._count + 2)
+
+    @classmethod
+    def create(cls, values, name=None):
+        """Write values into a new segment, done once by the parent process"""
+        # utf-8 bytes sort like the code points they encode
+        encoded = sorted({value.encode('utf-8') for value in values})
+        offsets = [0]
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        header = struct.pack('<{}I'.format(len(offsets) + 1), len(encoded), *offsets)
+        segment = shared_memory.SharedMemory(name=name, create=True, size=max(1, len(header) + offsets[-1]))
+        segment.buf[:len(header)] = header
+        segment.buf[len(header):len(header) + offsets[-1]] = b''.join(encoded)
+        return cls(segment, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Open an existing segment, done by every worker process"""
+        return cls(shared_memory.SharedMemory(name=name))
+
+    @property
+    def name(self):
+        return self._segment.name
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._encoded(index).decode('utf-8')
+
+    def _encoded(self, index):
+        start, end = struct.unpack_from('<2I', self._segment.buf, _uint.size * (index + 1))
+        return bytes(self._segment.buf[self._data_start + start:self._data_start + end])
+
+    def handle(self, value):
+        """Look up the flyweight of value by binary search over the sorted values"""
+        encoded = value.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._encoded(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count or self._encoded(low) != encoded:
+            raise KeyError(value)
+        return SharedFlyweight(self, low)
+
+    def close(self):
+        self._segment.close()
+
+    def unlink(self):
+        """Free the segment, called once by the process which created it"""
+        if self._owner:
+            self._segment.unlink()
+
+
+class SharedFlyweight(object):
+    """A handle into a SharedFlyweightTable"""
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def value(self):
+        return self.table[self.index]
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, SharedFlyweight) and self.table.name == other.table.name and self.index == other.index
+        )
+
+    def __hash__(self):
+        return hash((self.table.name, self.index))
+
+    def __repr__(self):
+        return '<SharedFlyweight {}: {!r}>'.format(self.index, self.value)
+
+
+def main():
+    """
+    >>> table = SharedFlyweightTable.create(['queen', 'ace', 'king', 'ace'])
+
+    # This is what a worker process does with the name it got from its parent
+    >>> worker_table = SharedFlyweightTable.attach(table.name)
+    >>> len(worker_table), worker_table[1]
+    (3, 'king')
+
+    >>> card = worker_table.handle('queen')
+    >>> card, card.value
+    (<SharedFlyweight 2: 'queen'>, 'queen')
+    >>> card == worker_table.handle('queen') == table.handle('queen')
+    True
+    >>> worker_table.handle('joker')
+    Traceback (most recent call last):
+    ...
+    KeyError: 'joker'
+
+    >>> worker_table.close()
+    >>> table.close()
+    >>> table.unlink()
+    """
+
+
+if shared_memory is None:
+    # nothing to demonstrate without shared_memory
+    main.__doc__ = None
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
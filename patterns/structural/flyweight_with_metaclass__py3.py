@@ -1,3 +1,7 @@
+import collections
+import sys
+import threading
+import time
 import weakref
 
 
@@ -11,31 +15,90 @@ class FlyweightMeta(type):
         :param dct: dict: includes class attributes, class methods,
         static methods, etc
         :return: new class
+
+        A class with lru_size > 0 also keeps strong references to its
+        lru_size most recently used instances, so they survive moments
+        without any other reference instead of being destroyed and rebuilt.
+        lru_stats counts pool hits, misses and LRU evictions of such a class.
         """
         dct['pool'] = weakref.WeakValueDictionary()
-        return super(FlyweightMeta, mcs).__new__(mcs, name, parents, dct)
+        cls = super(FlyweightMeta, mcs).__new__(mcs, name, parents, dct)
+        if getattr(cls, 'lru_size', 0) > 0:
+            cls.lru = collections.OrderedDict()
+            cls.lru_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+            cls._lru_lock = threading.Lock()
+        else:
+            cls.lru = None
+        return cls
 
     @staticmethod
     def _serialize_params(cls, *args, **kwargs):
         """
-        Serialize input parameters to a key.
-        Simple implementation is just to serialize it as a string
+        Build a key out of the input parameters.
+        The positional args tuple is used as it is, keyword args are added
+        in sorted order. Unlike joining their str() this can't mix up
+        Card2('1', '0h') and Card2('10', 'h'). The types of the values are
+        part of the key, like with functools.lru_cache(typed=True), so
+        1, 1.0 and True, which are equal, still give different instances.
+        Every class has its own pool, so the class is not part of the key.
+        Override it in a subclass of FlyweightMeta to choose what makes two
+        instances the same.
         """
-        args_list = list(map(str, args))
-        args_list.extend([str(kwargs), cls.__name__])
-        key = ''.join(args_list)
+        key = args + tuple(map(type, args))
+        if kwargs:
+            items = tuple(sorted(kwargs.items()))
+            return key, items, tuple(type(value) for _, value in items)
         return key
 
     def __call__(cls, *args, **kwargs):
-        key = FlyweightMeta._serialize_params(cls, *args, **kwargs)
+        key = type(cls)._serialize_params(cls, *args, **kwargs)
         pool = getattr(cls, 'pool', {})
 
-        instance = pool.get(key)
-        if instance is None:
-            instance = super(FlyweightMeta, cls).__call__(*args, **kwargs)
-            pool[key] = instance
+        try:
+            instance = pool.get(key)
+        except TypeError:
+            # unhashable params, e.g. a list
+            key = _freeze(key)
+            instance = pool.get(key)
+        hit = instance is not None
+        if not hit:
+            # built outside the lock, __init__ may create other flyweights
+            candidate = super(FlyweightMeta, cls).__call__(*args, **kwargs)
+            with _locks[hash(key) % len(_locks)]:
+                # another thread may have stored one meanwhile, it wins
+                instance = pool.get(key)
+                if instance is None:
+                    instance = pool[key] = candidate
+        if cls.lru is not None:
+            cls._touch(key, instance, hit)
         return instance
 
+    def _touch(cls, key, instance, hit):
+        with cls._lru_lock:
+            cls.lru_stats['hits' if hit else 'misses'] += 1
+            cls.lru[key] = instance
+            cls.lru.move_to_end(key)
+            while len(cls.lru) > cls.lru_size:
+                cls.lru.popitem(last=False)
+                cls.lru_stats['evictions'] += 1
+
+
+# Only taken to store a new instance, hits never lock and no user code
+# runs while one is held. Keys are spread over several locks so unrelated
+# insertions don't wait.
+_locks = [threading.Lock() for _ in range(16)]
+
+
+def _freeze(value):
+    """Hashable equivalent of a structure of tuples, lists, dicts and sets"""
+    if isinstance(value, (tuple, list)):
+        return type(value), tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return dict, frozenset((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (set, frozenset)):
+        return frozenset, frozenset(value)
+    return value
+
 
 class Card2(metaclass=FlyweightMeta):
     def __init__(self, *args, **kwargs):
@@ -43,7 +106,40 @@ class Card2(metaclass=FlyweightMeta):
         pass
 
 
-if __name__ == '__main__':
+class Card3(metaclass=FlyweightMeta):
+    lru_size = 2
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class StrKeyFlyweightMeta(FlyweightMeta):
+    """The previous key derivation, kept for comparison"""
+
+    @staticmethod
+    def _serialize_params(cls, *args, **kwargs):
+        args_list = list(map(str, args))
+        args_list.extend([str(kwargs), cls.__name__])
+        return ''.join(args_list)
+
+
+def benchmark(constructions=10 ** 7):
+    for meta in (StrKeyFlyweightMeta, FlyweightMeta):
+        card_class = meta('Card', (), {'__init__': Card2.__init__})
+        deck = [card_class(value, suit) for value in '23456789TJQKA' for suit in 'cdhs']
+        start = time.perf_counter()
+        for _ in range(constructions // len(deck)):
+            for value in '23456789TJQKA':
+                for suit in 'cdhs':
+                    card_class(value, suit)
+        elapsed = time.perf_counter() - start
+        print('{:<20} {:.2f}s for {} constructions'.format(meta.__name__, elapsed, constructions))
+        del deck
+
+
+if __name__ == '__main__' and '--benchmark' in sys.argv:
+    benchmark()
+elif __name__ == '__main__':
     instances_pool = getattr(Card2, 'pool')
     cm1 = Card2('10', 'h', a=1)
     cm2 = Card2('10', 'h', a=1)
@@ -61,3 +157,39 @@ if __name__ == '__main__':
 
     del cm3
     assert len(instances_pool) == 0
+
+    # str() based keys used to make these the same card
+    assert Card2('1', '0h') is not Card2('10', 'h')
+    # equal values of different types are different cards
+    assert Card2(1) is not Card2(True) and Card2(1) is not Card2(1.0)
+    assert Card2(a=1) is not Card2(a=True)
+    # unhashable params still work
+    assert Card2(['10'], 'h') is Card2(['10'], 'h')
+
+    # concurrent construction still gives one instance per key
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(8) as executor:
+        cards = list(executor.map(lambda _: Card2('Q', 's'), range(100)))
+    assert len(set(map(id, cards))) == 1
+
+    # __init__ may create other flyweights, whatever lock their keys use
+    class Suit(metaclass=FlyweightMeta):
+        def __init__(self, name):
+            self.name = name
+
+    class SuitedCard(metaclass=FlyweightMeta):
+        def __init__(self, value, suit):
+            self.value, self.suit = value, Suit(suit)
+
+    suited = [SuitedCard(value, suit) for value in range(50) for suit in 'cdhs']
+    assert suited[0].suit is suited[4].suit
+
+    # with an LRU tier recently used instances survive without references
+    cl1 = Card3('10', 'h')
+    cl1_id = id(cl1)
+    del cl1
+    assert id(Card3('10', 'h')) == cl1_id
+    Card3('J', 'h')
+    Card3('Q', 'h')
+    assert len(Card3.lru) == 2 and len(getattr(Card3, 'pool')) == 2
+    assert Card3.lru_stats == {'hits': 1, 'misses': 3, 'evictions': 1}
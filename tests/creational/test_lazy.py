@@ -1,8 +1,37 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from __future__ import print_function
+import threading
+import time
 import unittest
-from patterns.creational.lazy_evaluation import Person
+from patterns.creational.lazy_evaluation import (
+    Address,
+    Person,
+    expiring_lazy_property,
+    invalidate,
+    synchronized_lazy_property,
+)
+
+
+class Account(object):
+    def __init__(self):
+        self.call_count = 0
+
+    @synchronized_lazy_property
+    def balance(self):
+        self.call_count += 1
+        time.sleep(0.05)
+        return 42
+
+
+class Quote(object):
+    def __init__(self):
+        self.call_count = 0
+
+    @expiring_lazy_property(ttl=0.01)
+    def price(self):
+        self.call_count += 1
+        return self.call_count
 
 
 class TestDynamicExpanding(unittest.TestCase):
@@ -30,3 +59,71 @@ class TestDynamicExpanding(unittest.TestCase):
         for _ in range(2):
             self.assertEqual(self.John.parents, "Father and mother")
         self.assertEqual(self.John.call_count2, 1)
+
+
+class TestSynchronizedLazyProperty(unittest.TestCase):
+    def test_computed_once_for_concurrent_callers(self):
+        account = Account()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(account.balance)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [42] * 8)
+        self.assertEqual(account.call_count, 1)
+
+    def test_lock_is_removed_once_cached(self):
+        account = Account()
+        self.assertEqual(account.balance, 42)
+        self.assertDictEqual({'call_count': 1, 'balance': 42}, account.__dict__)
+
+    def test_lock_of_late_caller_is_removed(self):
+        # a thread which got to the descriptor before the value was cached,
+        # but takes the lock after the first caller removed it
+        account = Account()
+        self.assertEqual(account.balance, 42)
+        self.assertEqual(Account.__dict__['balance'].__get__(account, Account), 42)
+        self.assertDictEqual({'call_count': 1, 'balance': 42}, account.__dict__)
+
+
+class TestExpiringLazyProperty(unittest.TestCase):
+    def test_value_expires_after_ttl(self):
+        quote = Quote()
+        self.assertEqual(quote.price, 1)
+        self.assertEqual(quote.price, 1)
+        time.sleep(0.02)
+        self.assertEqual(quote.price, 2)
+
+    def test_invalidate(self):
+        quote = Quote()
+        self.assertEqual(quote.price, 1)
+        invalidate(quote, 'price')
+        self.assertEqual(quote.price, 2)
+
+    def test_dependency_invalidates_value(self):
+        John = Person('John', 'Coder')
+        self.assertEqual(John.business_card, 'John, Coder')
+        John.name = 'Johnny'
+        self.assertEqual(John.business_card, 'John, Coder')
+        John.occupation = 'Tester'
+        self.assertEqual(John.business_card, 'Johnny, Tester')
+
+
+class TestSlotLazyProperty(unittest.TestCase):
+    def setUp(self):
+        self.address = Address('Main street', 'Springfield')
+
+    def test_slot_empty_before_access(self):
+        self.assertRaises(AttributeError, getattr, self.address, '_label')
+
+    def test_value_cached_in_slot(self):
+        self.assertEqual(self.address.label, 'Main street, Springfield')
+        self.address.city = 'Shelbyville'
+        self.assertEqual(self.address.label, 'Main street, Springfield')
+
+    def test_invalidate(self):
+        self.assertEqual(self.address.label, 'Main street, Springfield')
+        self.address.city = 'Shelbyville'
+        invalidate(self.address, 'label')
+        self.assertEqual(self.address.label, 'Main street, Shelbyville')
@@ -6,7 +6,12 @@ try:
     import queue
 except ImportError:  # python 2.x compatibility
     import Queue as queue
-from patterns.creational.pool import ObjectPool
+import multiprocessing
+import os
+import threading
+import time
+
+from patterns.creational.pool import HealthCheckedQueue, ObjectPool, PoolMetrics, SharedBudgetQueue, ShardedQueue
 
 
 class TestPool(unittest.TestCase):
@@ -33,6 +38,214 @@ class TestPool(unittest.TestCase):
         self.assertTrue(self.sample_queue.empty())
 
 
+class TestHealthCheckedQueue(unittest.TestCase):
+    def test_invalid_object_is_not_put_back(self):
+        disposed = []
+        health_queue = HealthCheckedQueue(validate_on_return=lambda item: item != ['broken'], dispose=disposed.append)
+        health_queue.put(['first'])
+        with ObjectPool(health_queue) as obj:
+            obj[0] = 'broken'
+        self.assertTrue(health_queue.empty())
+        self.assertEqual(disposed, [['broken']])
+
+    def test_invalid_object_is_skipped_on_borrow(self):
+        health_queue = HealthCheckedQueue(validate_on_borrow=lambda item: item.startswith('ok'))
+        health_queue.put('bad')
+        health_queue.put('ok')
+        with ObjectPool(health_queue) as obj:
+            self.assertEqual(obj, 'ok')
+        self.assertEqual(health_queue.qsize(), 1)
+
+    def test_failing_validation_counts_as_invalid(self):
+        health_queue = HealthCheckedQueue(validate_on_return=lambda item: item.missing_method())
+        health_queue.put('first')
+        self.assertTrue(health_queue.empty())
+
+    def test_factory_replaces_missing_objects(self):
+        health_queue = HealthCheckedQueue(factory=lambda: ['new'])
+        with ObjectPool(health_queue) as obj:
+            self.assertEqual(obj, ['new'])
+        self.assertEqual(health_queue.qsize(), 1)
+
+    def test_maxsize_caps_created_objects(self):
+        health_queue = HealthCheckedQueue(maxsize=2, factory=list)
+        first, second = health_queue.get(), health_queue.get()
+        with self.assertRaises(queue.Empty):
+            health_queue.get(timeout=0.01)
+        health_queue.put(second)
+        self.assertIs(health_queue.get(block=False), second)
+
+    def test_returns_never_block(self):
+        health_queue = HealthCheckedQueue(maxsize=1, factory=list)
+        with ObjectPool(health_queue):
+            health_queue.put(['extra'])
+        self.assertEqual(health_queue.qsize(), 2)
+
+    def test_failed_creation_frees_its_slot(self):
+        attempts = []
+
+        def factory():
+            attempts.append(None)
+            if len(attempts) == 1:
+                raise RuntimeError('refused')
+            return ['new']
+
+        health_queue = HealthCheckedQueue(maxsize=1, factory=factory)
+        with self.assertRaises(RuntimeError):
+            health_queue.get()
+        self.assertEqual(health_queue.get(timeout=0.01), ['new'])
+
+    def test_idle_objects_are_reaped(self):
+        health_queue = HealthCheckedQueue(idle_timeout=0.01)
+        health_queue.put('first')
+        self.assertEqual(health_queue.reap(), 0)
+        time.sleep(0.02)
+        self.assertEqual(health_queue.reap(), 1)
+        self.assertTrue(health_queue.empty())
+
+    def test_aged_objects_are_recycled(self):
+        health_queue = HealthCheckedQueue(max_age=0.01, factory=lambda: ['new'])
+        old = ['old']
+        health_queue.put(old)
+        time.sleep(0.02)
+        with ObjectPool(health_queue) as obj:
+            self.assertIsNot(obj, old)
+            self.assertEqual(obj, ['new'])
+
+    def test_reaper_thread(self):
+        disposed = []
+        health_queue = HealthCheckedQueue(idle_timeout=0.01, dispose=disposed.append)
+        health_queue.put('first')
+        health_queue.start_reaper(interval=0.01)
+        try:
+            for _ in range(100):
+                if disposed:
+                    break
+                time.sleep(0.01)
+        finally:
+            health_queue.stop_reaper()
+        self.assertEqual(disposed, ['first'])
+
+
+class TestPoolMetrics(unittest.TestCase):
+    def setUp(self):
+        self.sample_queue = queue.Queue()
+        self.sample_queue.put('first')
+        self.sample_queue.put('second')
+        self.metrics = PoolMetrics()
+
+    def test_checkouts_and_high_water_mark(self):
+        with ObjectPool(self.sample_queue, metrics=self.metrics):
+            with ObjectPool(self.sample_queue, metrics=self.metrics):
+                self.assertEqual(self.metrics.in_use, 2)
+        with ObjectPool(self.sample_queue, metrics=self.metrics):
+            pass
+        self.assertEqual(self.metrics.checkouts, 3)
+        self.assertEqual(self.metrics.in_use, 0)
+        self.assertEqual(self.metrics.max_in_use, 2)
+        self.assertEqual(sum(self.metrics.wait_histogram), 3)
+
+    def test_gc_returns_are_counted(self):
+        pool = ObjectPool(self.sample_queue, True, metrics=self.metrics)
+        del pool
+        self.assertEqual(self.metrics.gc_returns, 1)
+        self.assertEqual(self.sample_queue.qsize(), 2)
+
+    def test_leaks_report_call_site(self):
+        pool = ObjectPool(self.sample_queue, True, metrics=self.metrics)
+        time.sleep(0.02)
+        leaks = self.metrics.leaks(0.01)
+        self.assertEqual(len(leaks), 1)
+        held_for, call_site = leaks[0]
+        self.assertGreater(held_for, 0.01)
+        self.assertIn('test_leaks_report_call_site', call_site)
+        with pool:
+            pass
+        self.assertEqual(self.metrics.leaks(0), [])
+
+
+class TestShardedQueue(unittest.TestCase):
+    def setUp(self):
+        self.sharded_queue = ShardedQueue(shards=4)
+
+    def test_object_pool_with_sharded_queue(self):
+        self.sharded_queue.put('first')
+        with ObjectPool(self.sharded_queue) as obj:
+            self.assertEqual(obj, 'first')
+            self.assertTrue(self.sharded_queue.empty())
+        self.assertEqual(self.sharded_queue.qsize(), 1)
+
+    def test_steals_from_sibling_shard(self):
+        thread = threading.Thread(target=self.sharded_queue.put, args=('first',))
+        thread.start()
+        thread.join()
+        self.assertEqual(self.sharded_queue.get(block=False), 'first')
+
+    def test_empty_queue_times_out(self):
+        self.assertRaises(queue.Empty, self.sharded_queue.get, block=False)
+        self.assertRaises(queue.Empty, self.sharded_queue.get, timeout=0.01)
+
+    def test_waiting_get_is_woken_up_by_put(self):
+        timer = threading.Timer(0.01, self.sharded_queue.put, args=('first',))
+        timer.start()
+        self.assertEqual(self.sharded_queue.get(timeout=5), 'first')
+        timer.join()
+
+
+def hold_two_objects(budget_queue, holding, done):
+    first, second = budget_queue.get(), budget_queue.get()
+    holding.set()
+    done.wait(5)
+    budget_queue.put(first)
+    budget_queue.put(second)
+    budget_queue.close()
+
+
+def die_holding_two_objects(budget_queue):
+    budget_queue.get(), budget_queue.get()
+    os._exit(0)
+
+
+class TestSharedBudgetQueue(unittest.TestCase):
+    def setUp(self):
+        self.budget_queue = SharedBudgetQueue(2, factory=list, max_idle=1)
+
+    def test_budget_is_enforced(self):
+        with ObjectPool(self.budget_queue):
+            with ObjectPool(self.budget_queue):
+                self.assertEqual(self.budget_queue.leased(), 2)
+                self.assertRaises(queue.Empty, self.budget_queue.get, timeout=0.01)
+        # one object stays idle in the process, the other slot is freed
+        self.assertEqual(self.budget_queue.qsize(), 1)
+        self.assertEqual(self.budget_queue.leased(), 1)
+        self.budget_queue.close()
+        self.assertEqual(self.budget_queue.leased(), 0)
+
+    def test_budget_is_shared_with_child_process(self):
+        holding, done = multiprocessing.Event(), multiprocessing.Event()
+        child = multiprocessing.Process(target=hold_two_objects, args=(self.budget_queue, holding, done))
+        child.start()
+        try:
+            self.assertTrue(holding.wait(5))
+            self.assertRaises(queue.Empty, self.budget_queue.get, timeout=0.01)
+        finally:
+            done.set()
+            child.join()
+        self.assertEqual(self.budget_queue.leased(), 0)
+        self.budget_queue.get(timeout=1)
+
+    def test_slots_of_dead_process_are_reclaimed(self):
+        child = multiprocessing.Process(target=die_holding_two_objects, args=(self.budget_queue,))
+        child.start()
+        child.join()
+        self.assertEqual(self.budget_queue.leased(), 2)
+        self.assertRaises(queue.Empty, self.budget_queue.get, timeout=0.01)
+        self.assertEqual(self.budget_queue.reclaim(), 2)
+        self.assertEqual(self.budget_queue.leased(), 0)
+        self.budget_queue.get(timeout=1)
+        self.assertEqual(self.budget_queue.reclaim(), 0)
+
+
 class TestNaitivePool(unittest.TestCase):
 
     """def test_object(queue):
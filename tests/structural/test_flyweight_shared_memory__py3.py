@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import multiprocessing
+import unittest
+
+from patterns.structural.flyweight_shared_memory__py3 import SharedFlyweightTable, shared_memory
+
+
+def look_up(name, values, results):
+    table = SharedFlyweightTable.attach(name)
+    try:
+        results.put([(table.handle(value).index, table.handle(value).value) for value in values])
+    finally:
+        table.close()
+
+
+@unittest.skipIf(shared_memory is None, 'requires multiprocessing.shared_memory')
+class TestSharedFlyweightTable(unittest.TestCase):
+    def setUp(self):
+        self.table = SharedFlyweightTable.create(['spades', 'hearts', 'clubs', 'diamonds', 'pique'])
+
+    def tearDown(self):
+        self.table.close()
+        self.table.unlink()
+
+    def test_values_are_deduplicated_and_sorted(self):
+        table = SharedFlyweightTable.create(['b', 'a', 'b'])
+        try:
+            self.assertEqual([table[index] for index in range(len(table))], ['a', 'b'])
+        finally:
+            table.close()
+            table.unlink()
+
+    def test_lookup_from_another_process(self):
+        results = multiprocessing.Queue()
+        worker = multiprocessing.Process(target=look_up, args=(self.table.name, ['hearts', 'pique'], results))
+        worker.start()
+        looked_up = results.get(timeout=5)
+        worker.join()
+        self.assertEqual(worker.exitcode, 0)
+        expected = [(self.table.handle(value).index, value) for value in ('hearts', 'pique')]
+        self.assertEqual(looked_up, expected)
+
+    def test_missing_value(self):
+        self.assertRaises(KeyError, self.table.handle, 'joker')
+        self.assertRaises(KeyError, self.table.handle, 'zzz')
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import threading
+import unittest
+
+if sys.version_info[0] > 2:
+    from patterns.other.blackboard__py3 import AgendaController, Blackboard
+    from patterns.other.blackboard_server__py3 import BlackboardServer, Counter, RemoteBlackboard
+
+
+def run_agenda(address, results):
+    blackboard = RemoteBlackboard(address)
+    try:
+        blackboard.add_expert(Counter(blackboard))
+        results.append(AgendaController(blackboard).run_loop())
+    finally:
+        blackboard.close()
+
+
+@unittest.skipIf(sys.version_info[0] < 3, 'requires python 3')
+class TestRemoteBlackboard(unittest.TestCase):
+    def setUp(self):
+        self.server = BlackboardServer(Blackboard()).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_concurrent_workers_under_agenda_controller(self):
+        results = []
+        workers = [threading.Thread(target=run_agenda, args=(self.server.server_address, results)) for _ in range(4)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for worker in workers:
+            worker.join(10)
+        self.assertFalse(any(worker.is_alive() for worker in workers))
+        self.assertEqual(sum(len(contributions) for contributions in results), 10)
+        self.assertEqual(self.server.blackboard.common_state['progress'], 100)
+
+    def test_synced_keys_are_reported_as_changes(self):
+        first = RemoteBlackboard(self.server.server_address)
+        second = RemoteBlackboard(self.server.server_address)
+        try:
+            second.common_state.take_changes()
+            first.contribute('Student', problems=2)
+            self.assertTrue(first.commit())
+            second.sync()
+            self.assertEqual(second.common_state.take_changes(), {'problems'})
+        finally:
+            first.close()
+            second.close()
+
+    def test_conflict_keeps_the_state_object(self):
+        first = RemoteBlackboard(self.server.server_address)
+        second = RemoteBlackboard(self.server.server_address)
+        try:
+            state = second.common_state
+            first.contribute('Student', progress=10)
+            self.assertTrue(first.commit())
+            second.contribute('Scientist', progress=20)
+            self.assertFalse(second.commit())
+            self.assertIs(second.common_state, state)
+            self.assertEqual(state['progress'], 10)
+        finally:
+            first.close()
+            second.close()